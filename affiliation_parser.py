@@ -0,0 +1,100 @@
+"""
+基于规则的作者单位提取
+
+常见模板（revtex / acmart 的 \\affiliation、\\institution，llncs 的 \\institute，authblk 的 \\affil，
+IEEEtran 的 \\IEEEauthorblockA）用宏明确标出了作者单位，可以直接解析而无需调用 LLM。
+解析不到结果时返回空列表，由调用方回退到 LLM。
+"""
+import re
+import threading
+from loguru import logger
+
+# 顶层机构的关键词，用于从 "Department of CS, XX University, City" 中挑出 "XX University"
+TOP_LEVEL_KEYWORDS = re.compile(
+    r'universit|universidad|college|institut|academy|school of|polytechnic|politecnico|'
+    r'laborator|\blab\b|\blabs\b|research|centre|center|\binc\b|\bltd\b|corporation|company|'
+    r'group|foundation|hospital|\bcnrs\b|\binria\b|\bmit\b|\beth\b|\bepfl\b|kaist|google|microsoft|'
+    r'meta\b|deepmind|openai|nvidia|alibaba|tencent|baidu|huawei|bytedance|amazon|apple|ibm|intel|samsung',
+    flags=re.IGNORECASE,
+)
+# 这些是二级单位，只有在找不到其他顶层机构时才保留
+SUB_UNIT = re.compile(r'^\s*(department|dept\.?|faculty|division|school of|key lab|state key lab|college of)\b',
+                      flags=re.IGNORECASE)
+EMAIL = re.compile(r'\S+@\S+')
+
+STATS = {'rule': 0, 'llm': 0}
+_stats_lock = threading.Lock()
+
+
+def _macro_arguments(content: str, name: str) -> list[str]:
+    """
+    返回 content 中所有 \\name[...]{...} 的花括号参数（支持嵌套花括号）
+    """
+    arguments = []
+    for match in re.finditer(r'\\' + name + r'\*?\s*(\[[^\]]*\])?\s*\{', content):
+        depth, start = 1, match.end()
+        i = start
+        while i < len(content) and depth:
+            if content[i] == '\\':
+                i += 2
+                continue
+            if content[i] == '{':
+                depth += 1
+            elif content[i] == '}':
+                depth -= 1
+            i += 1
+        if depth == 0:
+            arguments.append(content[start:i - 1])
+    return arguments
+
+
+def _clean(text: str) -> str:
+    """去掉 LaTeX 命令、上标编号、邮箱等，只保留纯文本"""
+    text = EMAIL.sub(' ', text)
+    text = re.sub(r'\$[^$]*\$', ' ', text)
+    text = re.sub(r'\\(inst|thanks|footnote|email|orcid|textsuperscript)\s*\{[^{}]*\}', ' ', text)
+    text = re.sub(r'\\[a-zA-Z]+\*?(\[[^\]]*\])?', ' ', text)
+    text = re.sub(r'[{}~]', ' ', text)
+    text = re.sub(r'^\s*\d+\s*', '', text)
+    return re.sub(r'\s+', ' ', text).strip(' ,;.')
+
+
+def _top_level(affiliation: str) -> str:
+    """从一条完整的单位描述中挑出顶层机构"""
+    segments = [_clean(s) for s in re.split(r',|\\\\|\\and|\\newline|\n', affiliation)]
+    segments = [s for s in segments if s]
+    candidates = [s for s in segments if TOP_LEVEL_KEYWORDS.search(s)]
+    top = [s for s in candidates if not SUB_UNIT.match(s)]
+    if top:
+        return top[0]
+    return candidates[0] if candidates else ''
+
+
+def extract_affiliations(author_region: str) -> list[str]:
+    """
+    从作者信息区域解析顶层机构，按出现顺序去重；无法解析时返回空列表
+    """
+    affiliations = []
+    # acmart 的 \institution 单独给出机构名，优先使用
+    institutions = _macro_arguments(author_region, 'institution')
+    if institutions:
+        affiliations = [_clean(i) for i in institutions]
+    else:
+        for name in ('affiliation', 'affil', 'IEEEauthorblockA'):
+            affiliations += [_top_level(a) for a in _macro_arguments(author_region, name)]
+        for institute in _macro_arguments(author_region, 'institute'):
+            affiliations += [_top_level(a) for a in re.split(r'\\and\b', institute)]
+    return list(dict.fromkeys(a for a in affiliations if a))
+
+
+def record(rule_based: bool):
+    """记录一次单位提取的来源（规则 / LLM）"""
+    with _stats_lock:
+        STATS['rule' if rule_based else 'llm'] += 1
+
+
+def report_affiliation_stats():
+    total = STATS['rule'] + STATS['llm']
+    if total:
+        logger.info(f"Affiliations: {STATS['rule']}/{total} papers parsed by rules "
+                    f"({STATS['rule'] / total:.1%} LLM calls avoided), {STATS['llm']} sent to LLM")
@@ -0,0 +1,117 @@
+"""
+Batch API 增强模式（适用于回填、周报等对延迟不敏感的任务）
+
+将所有论文的 TLDR / 标签 / 单位请求写入一个 JSONL 文件，提交到 OpenAI 兼容的 /v1/batches 接口，
+轮询直到完成后把结果写回 ArxivPaper 的缓存字段。未返回或解析失败的请求在渲染时回退到在线请求。
+"""
+import json
+import os
+import time
+from tempfile import TemporaryDirectory
+from typing import Optional
+from openai import OpenAI
+from loguru import logger
+from paper import ArxivPaper
+from llm import get_llm
+
+ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_batch_requests(papers: list[ArxivPaper], fields: list[list[str]], model: str) -> list[dict]:
+    """
+    构造 Batch API 的请求行，custom_id 形如 "{论文序号}:{字段}"
+    :param fields: 每篇论文需要生成的字段列表
+    """
+    requests = []
+    # 一个 batch 只能使用同一个模型，分配给其他模型（或本地模型）的任务在渲染时在线生成
+    batch_fields = {f for paper_fields in fields for f in paper_fields
+                    if not get_llm(f).is_local and (get_llm(f).model or model) == model}
+    for idx, (paper, paper_fields) in enumerate(zip(papers, fields)):
+        for field in paper_fields:
+            if field not in batch_fields:
+                continue
+            messages = paper.enrichment_messages(field)
+            if messages is None:
+                # 无需请求（例如无 LaTeX 源码，或单位已由规则解析），渲染时直接得到结果
+                continue
+            requests.append({
+                "custom_id": f"{idx}:{field}",
+                "method": "POST",
+                "url": ENDPOINT,
+                "body": {"model": model, "messages": messages, "temperature": 0},
+            })
+    return requests
+
+
+def apply_batch_results(papers: list[ArxivPaper], output: str) -> int:
+    """
+    将 Batch API 的输出（JSONL 文本）写回对应论文，返回成功写入的条数
+    """
+    applied = 0
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        idx, field = result["custom_id"].split(":", 1)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            logger.debug(f"Batch request {result['custom_id']} failed: {result.get('error') or response.get('status_code')}")
+            continue
+        content = response["body"]["choices"][0]["message"]["content"]
+        if papers[int(idx)].set_enrichment(field, content):
+            applied += 1
+    return applied
+
+
+def run_batch(client: OpenAI, requests: list[dict], poll_interval: float = 30.0,
+              timeout: float = 24 * 3600, completion_window: str = "24h") -> Optional[str]:
+    """
+    上传请求文件、创建 batch 并轮询到结束，返回输出文件内容；失败或超时返回 None
+    """
+    with TemporaryDirectory() as tmpdirname:
+        path = os.path.join(tmpdirname, "enrichment_batch.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        with open(path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+
+    batch = client.batches.create(input_file_id=input_file.id, endpoint=ENDPOINT, completion_window=completion_window)
+    logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+
+    deadline = time.monotonic() + timeout
+    while batch.status not in TERMINAL_STATES:
+        if time.monotonic() > deadline:
+            logger.error(f"Batch {batch.id} did not finish within {timeout:.0f}s, cancelling")
+            client.batches.cancel(batch.id)
+            return None
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        if counts is not None:
+            logger.debug(f"Batch {batch.id} {batch.status}: {counts.completed}/{counts.total} completed, {counts.failed} failed")
+
+    if batch.status != "completed" or not batch.output_file_id:
+        logger.error(f"Batch {batch.id} ended with status {batch.status}")
+        return None
+    return client.files.content(batch.output_file_id).text
+
+
+def enrich_papers_with_batch(papers: list[ArxivPaper], client: OpenAI, model: str, fields: list[list[str]],
+                             poll_interval: float = 30.0, timeout: float = 24 * 3600) -> int:
+    """
+    使用 Batch API 一次性生成所有论文的增强字段，返回成功写入的条数
+    :param client: OpenAI 兼容客户端（base_url 可指向本地模拟服务用于测试）
+    :param fields: 每篇论文需要生成的字段，取值为 tldr / tags / affiliations
+    """
+    requests = build_batch_requests(papers, fields, model)
+    if not requests:
+        return 0
+    start = time.monotonic()
+    output = run_batch(client, requests, poll_interval, timeout)
+    if output is None:
+        return 0
+    applied = apply_batch_results(papers, output)
+    logger.info(f"Batch enrichment applied {applied}/{len(requests)} results in {time.monotonic() - start:.0f}s")
+    return applied
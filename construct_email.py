@@ -2,11 +2,17 @@ from paper import ArxivPaper
 import math
 from tqdm import tqdm
 from email.header import Header
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import parseaddr, formataddr
 import smtplib
 import datetime
 import time
+import base64
+import hashlib
+import os
+import re
 from loguru import logger
 
 framework = """
@@ -85,6 +91,38 @@ To unsubscribe, remove your email in your Github Action setting.
 </html>
 """
 
+class InlineImages:
+    """
+    邮件内嵌图片：每张图片作为 multipart/related 的一个部分附加一次，HTML 中通过 cid: 引用，
+    避免 data URI 使 HTML 正文膨胀约 33%（不少客户端还会屏蔽或截断 data URI）。按内容去重，
+    多篇论文使用同一张图片时只附加一份
+    """
+
+    def __init__(self):
+        self.images: dict[str, tuple[bytes, str]] = {}  # Content-ID -> (图片字节, MIME 类型)
+
+    @staticmethod
+    def content_id(data: bytes) -> str:
+        """Content-ID 由内容哈希决定，相同图片得到相同的引用"""
+        return f"{hashlib.sha256(data).hexdigest()[:16]}@daily-arxiv"
+
+    def add(self, data: bytes, mime_type: str = 'image/png') -> str:
+        """添加图片，返回可以直接用作 img src 的 cid: 引用"""
+        cid = self.content_id(data)
+        self.images.setdefault(cid, (data, mime_type))
+        return f"cid:{cid}"
+
+    def add_base64(self, image_base64: str, mime_type: str = 'image/png') -> str:
+        return self.add(base64.b64decode(image_base64), mime_type)
+
+    def __len__(self):
+        return len(self.images)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(len(data) for data, _ in self.images.values())
+
+
 def get_empty_html():
   block_template = """
   <table border="0" cellpadding="0" cellspacing="0" width="100%" style="font-family: Arial, sans-serif; border: 1px solid #ddd; border-radius: 8px; padding: 16px; background-color: #f9f9f9;">
@@ -118,7 +156,9 @@ def get_block_html(title:str, authors:str, rate:str,arxiv_id:str, abstract:str,
     # 生成overview figure的HTML（缩略图 + 点击跳转到论文页面）
     overview_html = ''
     if overview_figure:
-        image_base64 = overview_figure.get('image_base64', '')
+        # 优先使用 cid: 引用，未提供时回退到 data URI
+        image_src = overview_figure.get('image_src') or \
+            f"data:{overview_figure.get('image_mime', 'image/png')};base64,{overview_figure.get('image_base64', '')}"
         caption = overview_figure.get('caption', '')
         description = overview_figure.get('description', '')
 
@@ -135,7 +175,7 @@ def get_block_html(title:str, authors:str, rate:str,arxiv_id:str, abstract:str,
                 <strong style="font-size: 14px; color: #333;">Architecture Overview:</strong>
                 <div style="margin-top: 8px; text-align: left; max-width: 100%; overflow: hidden;">
                     <a href="{arxiv_abs_url}" target="_blank" title="点击查看论文完整版" style="display: inline-block; position: relative; max-width: 100%;">
-                        <img src="data:image/png;base64,{image_base64}" alt="Architecture" style="width: 100%; max-width: 100%; height: auto; max-height: 250px; object-fit: contain; display: block; border: 1px solid #ddd; border-radius: 4px; cursor: pointer;">
+                        <img src="{image_src}" alt="Architecture" style="width: 100%; max-width: 100%; height: auto; max-height: 250px; object-fit: contain; display: block; border: 1px solid #ddd; border-radius: 4px; cursor: pointer;">
                         <div style="position: absolute; bottom: 8px; right: 8px; background-color: rgba(0,0,0,0.6); color: white; padding: 4px 8px; border-radius: 4px; font-size: 11px; pointer-events: none;">点击查看论文</div>
                     </a>
                 </div>
@@ -191,6 +231,24 @@ def get_block_html(title:str, authors:str, rate:str,arxiv_id:str, abstract:str,
 """
     return block_template.format(title=title, authors=authors, rate=rate, arxiv_id=arxiv_id, abstract=abstract, pdf_url=pdf_url, code=code, affiliation_html=affiliation_html, tags=tags_html, overview=overview_html)
 
+def get_compact_block_html(title:str, authors:str, rate:str, arxiv_id:str, pdf_url:str):
+    """排在邮件预算之外的论文只显示标题、作者和链接，不生成 TLDR、标签等增强内容"""
+    block_template = """
+    <table border="0" cellpadding="0" cellspacing="0" width="100%" style="font-family: Arial, sans-serif; border: 1px solid #ddd; border-radius: 8px; padding: 10px 16px; background-color: #f9f9f9; max-width: 100%; table-layout: fixed; box-sizing: border-box;">
+    <tr>
+        <td style="font-size: 15px; font-weight: bold; color: #333; word-wrap: break-word;">
+            <a href="https://arxiv.org/abs/{arxiv_id}" target="_blank" style="color: #333; text-decoration: none;">{title}</a> {rate}
+        </td>
+    </tr>
+    <tr>
+        <td style="font-size: 13px; color: #666; padding-top: 4px;">
+            {authors} · <a href="{pdf_url}">PDF</a>
+        </td>
+    </tr>
+</table>
+"""
+    return block_template.format(title=title, authors=authors, rate=rate, arxiv_id=arxiv_id, pdf_url=pdf_url)
+
 def get_stars(score:float):
     full_star = '<span class="full-star">⭐</span>'
     half_star = '<span class="half-star">⭐</span>'
@@ -208,19 +266,119 @@ def get_stars(score:float):
         return '<div class="star-wrapper">'+full_star * full_star_num + half_star * half_star_num + '</div>'
 
 
-def render_email(papers:list[ArxivPaper]):
-    import os
+# 估算区块大小时各字段的典型长度（字节）
+TYPICAL_FIELD_BYTES = {'title': 100, 'authors': 80, 'affiliations': 150, 'tldr': 500, 'tag': 20,
+                       'caption': 250, 'description': 400}
+
+
+def _minify_css(css:str) -> str:
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s*([{};:,])\s*', r'\1', css)
+    return re.sub(r'\s+', ' ', css).replace(';}', '}').strip()
+
 
+def minify_html(html:str) -> str:
+    """
+    压缩模板产生的空白：<style> 元素去掉 CSS 注释和多余空白，标签内的换行缩进合并，内联样式去掉多余空格，
+    只含换行缩进的文本节点删除。论文标题、TLDR、图片说明等文本节点的内容保持不变，
+    只把模板在其首尾留下的换行缩进合并为一个空格
+    """
     parts = []
+    for match in re.finditer(r'(<style\b[^>]*>)(.*?)(</style>)|<[a-zA-Z/!][^>]*>|[^<]+|<', html, flags=re.DOTALL | re.IGNORECASE):
+        token = match.group(0)
+        if match.group(1):
+            parts.append(match.group(1) + _minify_css(match.group(2)) + match.group(3))
+        elif re.match(r'<[a-zA-Z/!]', token):
+            token = re.sub(r'\s*\n\s*', ' ', token)
+            parts.append(re.sub(r'style="([^"]*)"', lambda m: 'style="' + _minify_css(m.group(1)).rstrip(';') + '"', token))
+        elif token.isspace():
+            parts.append('' if '\n' in token else token)
+        else:
+            parts.append(re.sub(r'^\s*\n\s*|\s*\n\s*$', ' ', token))
+    return ''.join(parts).strip()
+
+
+def html_size(html:str) -> int:
+    return len(html.encode('utf-8'))
+
+
+def estimate_block_sizes() -> dict[str, int]:
+    """
+    用典型长度的字段渲染示例区块，估算压缩后的紧凑区块和完整区块（含 TLDR、标签）的大小，
+    以及作者单位和图片部分各自增加的字节数
+    """
+    sample = {k: 'x' * v for k, v in TYPICAL_FIELD_BYTES.items()}
+    args = dict(title=sample['title'], authors=sample['authors'], rate=get_stars(8), arxiv_id='2501.00001',
+                abstract=sample['tldr'], pdf_url='https://arxiv.org/pdf/2501.00001v1',
+                code_url='https://github.com/xxxxxxxx/xxxxxxxx', tags=[sample['tag']] * 5)
+    separator = len('<br></br>')
+    compact = html_size(minify_html(get_compact_block_html(args['title'], args['authors'], args['rate'],
+                                                           args['arxiv_id'], args['pdf_url'])))
+    base = html_size(minify_html(get_block_html(**args)))
+    details = html_size(minify_html(get_block_html(**args, affiliations=sample['affiliations']))) - base
+    figure = {'image_src': f"cid:{'0' * 16}@daily-arxiv", 'caption': sample['caption'],
+              'description': sample['description']}
+    figure = html_size(minify_html(get_block_html(**args, overview_figure=figure))) - base
+    return {'compact': compact + separator, 'base': base + separator, 'details': details, 'figure': figure}
+
+
+def plan_email(num_papers:int, budget:int=None) -> list[dict]:
+    """
+    在增强之前按邮件 HTML 字节预算决定每篇论文显示哪些内容：
+    summary（完整区块，需要生成 TLDR 和标签）、details（作者单位）和 figure（图片）
+    Gmail 会截断超过约 102KB 的 HTML，被截断部分的增强结果读者看不到，不值得生成。
+    每篇论文至少保留紧凑的一行（标题、作者、链接）；剩余预算按排序先后分配，排在前面的论文依次得到
+    完整区块、作者单位和图片，预算用完后的论文只显示紧凑行。DETAILED_INFO_LIMIT 和功能开关仍然生效
+    :param budget: HTML 字节预算，默认读取 EMAIL_HTML_BUDGET，0 表示不限制
+    :return: 每篇论文一个 {'summary': bool, 'details': bool, 'figure': bool}
+    """
+    detailed_info_limit = int(os.getenv('DETAILED_INFO_LIMIT', '-1'))
+    enable_affiliations = os.getenv('ENABLE_AFFILIATIONS', 'true').lower() == 'true'
+    enable_overview_figure = os.getenv('ENABLE_OVERVIEW_FIGURE', 'true').lower() == 'true'
+    budget = budget if budget is not None else int(os.getenv('EMAIL_HTML_BUDGET', '100000'))
+    plan = []
+    for idx in range(num_papers):
+        within_limit = detailed_info_limit == -1 or idx < detailed_info_limit
+        plan.append({'summary': True, 'details': enable_affiliations and within_limit,
+                     'figure': enable_overview_figure and within_limit})
+    if budget <= 0 or num_papers == 0:
+        return plan
+
+    sizes = estimate_block_sizes()
+    used = html_size(minify_html(framework.replace('__CONTENT__', ''))) + num_papers * sizes['compact']
+    for item in plan:
+        if used + sizes['base'] - sizes['compact'] > budget:
+            item.update(summary=False, details=False, figure=False)
+            continue
+        used += sizes['base'] - sizes['compact']
+        for part in ('details', 'figure'):
+            if not item[part]:
+                continue
+            if used + sizes[part] <= budget:
+                used += sizes[part]
+            else:
+                item[part] = False
+    logger.debug(f"Email plan: {sum(i['summary'] for i in plan)}/{num_papers} full blocks, "
+                 f"{sum(i['details'] for i in plan)} with affiliations, {sum(i['figure'] for i in plan)} with figures, "
+                 f"estimated {used / 1024:.0f}KB / {budget / 1024:.0f}KB")
+    return plan
+
+
+def render_email(papers:list[ArxivPaper]) -> tuple[str, InlineImages]:
+    """
+    渲染邮件，作者单位和图片按 plan_email 的预算分配生成
+    :return: (HTML, 内嵌图片)，两者一起传给 send_email
+    """
+    parts = []
+    inline_images = InlineImages()
     if len(papers) == 0 :
-        return framework.replace('__CONTENT__', get_empty_html())
+        return minify_html(framework.replace('__CONTENT__', get_empty_html())), inline_images
 
     # 读取功能开关配置
     enable_affiliations = os.getenv('ENABLE_AFFILIATIONS', 'true').lower() == 'true'
     enable_code_url = os.getenv('ENABLE_CODE_URL', 'true').lower() == 'true'
     enable_tags = os.getenv('ENABLE_TAGS', 'true').lower() == 'true'
     enable_overview_figure = os.getenv('ENABLE_OVERVIEW_FIGURE', 'true').lower() == 'true'
-    detailed_info_limit = int(os.getenv('DETAILED_INFO_LIMIT', '-1'))
     email_interval = int(os.getenv('EMAIL_INTERVAL', '10'))
 
     # 读取图片提取模式（默认为 vision_llm）
@@ -228,7 +386,12 @@ def render_email(papers:list[ArxivPaper]):
 
     logger.info(f"功能开关状态: affiliations={enable_affiliations}, code_url={enable_code_url}, "
                 f"tags={enable_tags}, overview_figure={enable_overview_figure}")
-    logger.info(f"图片提取模式: {image_mode}, 详细信息限制: {detailed_info_limit if detailed_info_limit > 0 else '无限制'}")
+    logger.info(f"图片提取模式: {image_mode}")
+    plan = plan_email(len(papers))
+    budget = int(os.getenv('EMAIL_HTML_BUDGET', '100000'))
+    if budget > 0:
+        logger.info(f"邮件预算 {budget / 1024:.0f}KB: {sum(i['summary'] for i in plan)}/{len(papers)} 篇论文显示完整内容，"
+                    f"{sum(i['details'] for i in plan)} 篇显示作者单位，{sum(i['figure'] for i in plan)} 篇显示图片")
 
     for idx, p in enumerate(tqdm(papers, desc='Rendering Email')):
         rate = get_stars(p.score)
@@ -240,12 +403,14 @@ def render_email(papers:list[ArxivPaper]):
         else:
             authors = ', '.join(author_list[:3] + ['...'] + author_list[-2:])
 
-        # 判断是否在详细信息提取范围内（懒加载策略）
-        should_extract_details = (detailed_info_limit == -1) or (idx < detailed_info_limit)
+        if not plan[idx]['summary']:
+            # 预算之外的论文只显示紧凑行，不触发任何增强
+            parts.append({'compact': (p.title, authors, rate, p.arxiv_id, p.pdf_url)})
+            continue
 
-        # 提取作者单位信息（根据开关和懒加载策略）
+        # 提取作者单位信息（根据开关和预算分配，未分配的论文不会触发生成）
         affiliations = 'Unknown Affiliation'
-        if enable_affiliations and should_extract_details:
+        if enable_affiliations and plan[idx]['details']:
             if p.affiliations is not None:
                 affiliations = p.affiliations[:5]
                 affiliations = ', '.join(affiliations)
@@ -262,9 +427,9 @@ def render_email(papers:list[ArxivPaper]):
         if enable_tags:
             tags = p.tags
 
-        # 根据模式和开关选择图片提取方式（根据懒加载策略）
+        # 根据模式和开关选择图片提取方式（根据预算分配）
         overview_figure = None
-        if enable_overview_figure and should_extract_details:
+        if enable_overview_figure and plan[idx]['figure']:
             if image_mode == 'vision_llm':
                 # 默认模式：使用 Vision LLM 提取架构图
                 overview_figure = p.overview_figure
@@ -276,23 +441,79 @@ def render_email(papers:list[ArxivPaper]):
                     first_image = key_images_result['images'][0]
                     overview_figure = {
                         'image_base64': first_image.get('base64_data', ''),
+                        'image_mime': first_image.get('mime_type', 'image/png'),
                         'caption': first_image.get('filename', 'Key Figure'),
                         'description': first_image.get('description', '')
                     }
                     logger.info(f"使用 mineru 模式提取了 {key_images_result['count']} 张图片，显示第一张")
 
-        parts.append(get_block_html(p.title, authors,rate,p.arxiv_id ,p.tldr, p.pdf_url, code_url, affiliations, tags, overview_figure))
+        parts.append({'args': (p.title, authors, rate, p.arxiv_id, p.tldr, p.pdf_url, code_url, affiliations, tags),
+                      'compact': (p.title, authors, rate, p.arxiv_id, p.pdf_url),
+                      'figure': overview_figure if overview_figure and overview_figure.get('image_base64') else None})
         time.sleep(email_interval)  # 使用配置的间隔时间
 
-    content = '<br>' + '</br><br>'.join(parts) + '</br>'
-    return framework.replace('__CONTENT__', content)
-
-def send_email(sender:str, receiver:str, password:str,smtp_server:str,smtp_port:int, html:str,):
+    def render_block(part):
+        if 'args' not in part:
+            return minify_html(get_compact_block_html(*part['compact']))
+        figure = part['figure']
+        if figure:
+            # 确定保留图片后才附加到邮件，这里只生成引用
+            figure = {**figure, 'image_src': f"cid:{InlineImages.content_id(base64.b64decode(figure['image_base64']))}"}
+        return minify_html(get_block_html(*part['args'], overview_figure=figure))
+
+    blocks = [render_block(part) for part in parts]
+    # 实际内容比估算更长时，从排名最后的论文开始先去掉图片，仍然超出时再收起为紧凑行，保证前面的内容不被截断
+    total = html_size(minify_html(framework.replace('__CONTENT__', ''))) + sum(html_size(b) + len('<br></br>') for b in blocks)
+    for shrink in ('figure', 'summary'):
+        for idx in reversed(range(len(parts))):
+            if budget <= 0 or total <= budget:
+                break
+            if 'args' not in parts[idx] or (shrink == 'figure' and not parts[idx]['figure']):
+                continue
+            if shrink == 'figure':
+                parts[idx]['figure'] = None
+            else:
+                del parts[idx]['args']
+                parts[idx]['figure'] = None
+            new_block = render_block(parts[idx])
+            total -= html_size(blocks[idx]) - html_size(new_block)
+            blocks[idx] = new_block
+            logger.debug(f"Dropped {shrink} of {parts[idx]['compact'][3]} to fit the email budget")
+    if budget > 0 and total > budget:
+        logger.warning(f"Email HTML is {total / 1024:.0f}KB, over the {budget / 1024:.0f}KB budget; some clients may clip it.")
+
+    for part in parts:
+        if part.get('figure'):
+            # 图片已在提取时规范化，这里只作为内嵌附件附加
+            inline_images.add_base64(part['figure']['image_base64'], part['figure'].get('image_mime', 'image/png'))
+
+    content = '<br>' + '</br><br>'.join(blocks) + '</br>'
+    if inline_images:
+        logger.info(f"邮件内嵌 {len(inline_images)} 张图片，共 {inline_images.total_bytes / 1024:.0f}KB")
+    return minify_html(framework.replace('__CONTENT__', content)), inline_images
+
+def build_message(html:str, inline_images:InlineImages=None):
+    """
+    构建邮件正文：没有图片时为单个 text/html，否则为 multipart/related，图片通过 Content-ID 引用
+    """
+    if not inline_images:
+        return MIMEText(html, 'html', 'utf-8')
+    msg = MIMEMultipart('related')
+    msg.attach(MIMEText(html, 'html', 'utf-8'))
+    for cid, (data, mime_type) in inline_images.images.items():
+        subtype = mime_type.split('/')[-1]
+        image = MIMEImage(data, _subtype=subtype)
+        image.add_header('Content-ID', f'<{cid}>')
+        image.add_header('Content-Disposition', 'inline', filename=f"{cid.split('@')[0]}.{subtype.replace('jpeg', 'jpg')}")
+        msg.attach(image)
+    return msg
+
+def send_email(sender:str, receiver:str, password:str,smtp_server:str,smtp_port:int, html:str, inline_images:InlineImages=None):
     def _format_addr(s):
         name, addr = parseaddr(s)
         return formataddr((Header(name, 'utf-8').encode(), addr))
 
-    msg = MIMEText(html, 'html', 'utf-8')
+    msg = build_message(html, inline_images)
     msg['From'] = _format_addr('Github Action <%s>' % sender)
     msg['To'] = _format_addr('You <%s>' % receiver)
     today = datetime.datetime.now().strftime('%Y/%m/%d')
@@ -0,0 +1,93 @@
+"""
+基于内容哈希的磁盘缓存
+
+以请求内容（图片字节、prompt、模型名等）的 SHA-256 作为键，把 JSON 可序列化的结果保存在
+CACHE_DIR 下，重复运行、多收件人或论文新版本包含相同内容时直接复用，不再重复调用慢且贵的接口。
+GitHub Actions 中可以配合 actions/cache 持久化该目录。
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Optional
+from loguru import logger
+
+
+class DiskCache:
+    """
+    一个命名空间下的 JSON 缓存，每个条目一个文件，写入通过临时文件 + 原子替换完成
+    """
+
+    def __init__(self, name: str, directory: str = None):
+        self.name = name
+        self.directory = Path(directory or os.getenv('CACHE_DIR', '.cache')) / name
+        self.enabled = os.getenv('ENABLE_CACHE', 'true').lower() == 'true'
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(*parts) -> str:
+        """按顺序对各部分（str 或 bytes）计算 SHA-256"""
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+            # 写入长度前缀，避免不同切分方式得到相同的键
+            digest.update(len(data).to_bytes(8, 'little'))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            value = None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.debug(f"Ignoring unreadable {self.name} cache entry {path}: {e}")
+            value = None
+        with self._lock:
+            self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write {self.name} cache entry: {e}")
+
+    def report(self) -> str:
+        total = self.stats['hits'] + self.stats['misses']
+        rate = self.stats['hits'] / total if total else 0
+        return f"{self.name} cache: {self.stats['hits']}/{total} hits ({rate:.1%})"
+
+
+_caches: dict[str, DiskCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str) -> DiskCache:
+    """按名称获取共享的缓存实例"""
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = DiskCache(name)
+        return _caches[name]
+
+
+def report_caches():
+    for cache in _caches.values():
+        if cache.stats['hits'] + cache.stats['misses']:
+            logger.info(cache.report())
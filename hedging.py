@@ -0,0 +1,151 @@
+"""
+对冲请求（hedged requests），降低 LLM 调用的长尾延迟
+
+请求超过近期延迟的 p95 仍未返回时，再发送一个副本（同一接口或备用接口），先返回的结果胜出。
+额外请求的比例受上限控制，并在运行结束时输出统计。
+落败的请求会被取消：尚未开始的直接取消；已经开始的在两次重试之间检查取消标志（cancelled / wait_or_cancelled），
+不再重试，也不计入并发控制器的统计。已经发出的同步 HTTP 请求无法中途中断，其结果被丢弃。
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextvars import ContextVar
+from typing import Callable, Optional
+from loguru import logger
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_HEDGE_THREADS', '32')), thread_name_prefix='hedge')
+# 当前线程中对冲请求的取消标志，非对冲请求为 None
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar('hedge_cancel_event', default=None)
+
+
+class HedgeCancelled(Exception):
+    """对冲中落败的请求已被取消"""
+
+
+def cancelled() -> bool:
+    """当前请求是否已在对冲中落败"""
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def wait_or_cancelled(seconds: float) -> bool:
+    """等待 seconds 秒（重试前的退避），请求被取消时提前返回 True"""
+    event = _cancel_event.get()
+    if event is None:
+        time.sleep(seconds)
+        return False
+    return event.wait(seconds)
+
+
+class HedgePolicy:
+    """
+    基于近期延迟分位数决定何时发送副本请求，并限制副本请求占总请求的比例
+    """
+
+    def __init__(self, name: str, quantile: float = 0.95, max_ratio: float = 0.1, min_samples: int = 20,
+                 default_deadline: float = 30.0, window: int = 200):
+        """
+        :param name: 名称（用于日志）
+        :param quantile: 触发对冲的延迟分位数
+        :param max_ratio: 副本请求数占总请求数的上限
+        :param min_samples: 样本数不足时使用 default_deadline
+        :param default_deadline: 默认的对冲等待时间（秒）
+        :param window: 统计延迟时保留的最近样本数
+        """
+        self.name = name
+        self.quantile = quantile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.default_deadline = default_deadline
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    def deadline(self) -> float:
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.default_deadline
+            ordered = sorted(self._latencies)
+        return ordered[min(int(len(ordered) * self.quantile), len(ordered) - 1)]
+
+    def _timed(self, fn: Callable, cancel: threading.Event) -> Callable:
+        def run():
+            _cancel_event.set(cancel)
+            start = time.monotonic()
+            result = fn()
+            with self._lock:
+                self._latencies.append(time.monotonic() - start)
+            return result
+        return run
+
+    def _reserve_hedge(self) -> bool:
+        with self._lock:
+            if self.stats['hedged'] + 1 > self.stats['requests'] * self.max_ratio:
+                return False
+            self.stats['hedged'] += 1
+            return True
+
+    def run(self, primary: Callable, alternate: Optional[Callable] = None):
+        """
+        执行请求，超过截止时间仍未返回时发送副本（alternate，默认与 primary 相同），返回最先成功的结果
+        """
+        with self._lock:
+            self.stats['requests'] += 1
+        deadline = self.deadline()
+        first_cancel, second_cancel = threading.Event(), threading.Event()
+        first = _executor.submit(self._timed(primary, first_cancel))
+        done, _ = wait([first], timeout=deadline)
+        if done or not self._reserve_hedge():
+            return first.result()
+
+        logger.debug(f"{self.name} request exceeded {deadline:.1f}s, sending hedged request")
+        second = _executor.submit(self._timed(alternate or primary, second_cancel))
+        events = {first: first_cancel, second: second_cancel}
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                        events[loser].set()
+                    if future is second:
+                        with self._lock:
+                            self.stats['hedge_wins'] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def report(self) -> str:
+        ratio = self.stats['hedged'] / self.stats['requests'] if self.stats['requests'] else 0
+        return (f"{self.name} hedging: {self.stats['hedged']}/{self.stats['requests']} requests hedged "
+                f"({ratio:.1%}), hedge won {self.stats['hedge_wins']} times, current deadline {self.deadline():.1f}s")
+
+
+_policies: dict[str, HedgePolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def hedging_enabled() -> bool:
+    return os.getenv('LLM_HEDGE', 'false').lower() == 'true'
+
+
+def get_hedge_policy(name: str) -> HedgePolicy:
+    """按请求类型（如 text / vision）获取共享的对冲策略"""
+    with _policies_lock:
+        if name not in _policies:
+            _policies[name] = HedgePolicy(
+                name,
+                quantile=float(os.getenv('LLM_HEDGE_QUANTILE', '0.95')),
+                max_ratio=float(os.getenv('LLM_HEDGE_MAX_RATIO', '0.1')),
+                default_deadline=float(os.getenv('LLM_HEDGE_DEADLINE', '30')),
+            )
+        return _policies[name]
+
+
+def report_hedging():
+    for policy in _policies.values():
+        logger.info(policy.report())
@@ -1,13 +1,27 @@
-import base64
 import requests
 import time
 import json
 import os
-from typing import List, Dict, Optional, Tuple
-from openai import OpenAI
+import re
+from typing import Callable, List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, RateLimitError, APIConnectionError, InternalServerError
 from pathlib import Path
 from loguru import logger
 import zipfile
+from tempfile import SpooledTemporaryFile
+from image_utils import encode_image, prefilter_images
+from disk_cache import DiskCache, get_cache
+from rate_limiter import get_controller, wait_time_from_headers
+from image_store import get_image_store
+
+
+def read_image_bytes(image: Dict) -> bytes:
+    """读取图片内容：内存中提取的图片直接返回，否则从 path 读取"""
+    if image.get('data') is not None:
+        return image['data']
+    with open(image['path'], "rb") as image_file:
+        return image_file.read()
 
 
 class MinerUExtractor:
@@ -23,6 +37,7 @@ class MinerUExtractor:
         # 根据test_mineU.py中的正确URL格式配置
         self.task_submit_url = f"{self.base_url}/task/batch"
         self.result_query_url = f"{self.base_url}-results/batch/{{batch_id}}"
+        self.model_version = os.getenv('MINERU_MODEL_VERSION', 'vlm')
 
     def extract_images_from_pdf(self, pdf_url: str, max_images: int = 5,
                                max_attempts: int = 60, check_interval: int = 15) -> List[Dict]:
@@ -52,9 +67,7 @@ class MinerUExtractor:
                 return []
 
             # 步骤3: 下载并提取图片
-            output_dir = os.path.join(os.getcwd(), "extracted_images")
-            os.makedirs(output_dir, exist_ok=True)
-            images = self._download_and_extract_images(zip_url, output_dir, max_images)
+            images = self._download_and_extract_images(zip_url, max_images)
             return images
 
         except Exception as e:
@@ -63,12 +76,14 @@ class MinerUExtractor:
 
     def _submit_task(self, pdf_url: str) -> Optional[str]:
         """提交MinerU任务"""
+        return self._submit_files([{"url": pdf_url, "data_id": f"pdf_{int(time.time())}"}])
+
+    def _submit_files(self, files: List[Dict]) -> Optional[str]:
+        """提交一个包含多个PDF的MinerU任务，files 中每项包含 url 和 data_id"""
         # 使用正确的URL格式（根据test_mineU.py）
         data = {
-            "files": [
-                {"url": pdf_url, "data_id": f"pdf_{int(time.time())}"}
-            ],
-            "model_version": "vlm"
+            "files": files,
+            "model_version": self.model_version
         }
 
         try:
@@ -165,76 +180,121 @@ class MinerUExtractor:
         logger.error(f"MinerU任务处理超时: {batch_id} (尝试了 {max_attempts} 次)")
         return None
 
-    def _download_and_extract_images(self, zip_url: str, output_dir: str, max_images: int) -> List[Dict]:
-        """下载zip文件并提取图片"""
+    def extract_batch(self, pdf_urls: List[str], on_done: Callable[[str, Optional[str]], None],
+                      timeout: float = 900, min_interval: float = 5, max_interval: float = 30,
+                      batch_size: int = 200):
+        """
+        将所有PDF放在一个任务中提交，由单个轮询循环跟踪全部文件的状态。
+        每个文件完成（或失败）时立即调用 on_done(pdf_url, zip_url)，失败时 zip_url 为 None。
+        轮询间隔从 min_interval 开始，没有新结果时逐步放大到 max_interval，有文件完成时重置。
+
+        Args:
+            pdf_urls: PDF文件URL列表
+            on_done: 结果回调
+            timeout: 整体超时时间（秒），超时后未完成的文件按失败处理
+            min_interval: 最小查询间隔（秒）
+            max_interval: 最大查询间隔（秒）
+            batch_size: 单个任务最多包含的文件数
+        """
+        pending = {}  # (batch_id, data_id) -> pdf_url
+        for start in range(0, len(pdf_urls), batch_size):
+            chunk = pdf_urls[start:start + batch_size]
+            files = [{"url": url, "data_id": f"paper_{start + i}"} for i, url in enumerate(chunk)]
+            batch_id = self._submit_files(files)
+            if not batch_id:
+                logger.error(f"无法提交MinerU批量任务（{len(chunk)} 个文件）")
+                for url in chunk:
+                    on_done(url, None)
+                continue
+            pending.update({(batch_id, f["data_id"]): f["url"] for f in files})
+        if not pending:
+            return
+        logger.info(f"MinerU批量任务已提交: {len(pending)} 个文件")
+
+        deadline = time.monotonic() + timeout
+        interval = min_interval
+        while pending and time.monotonic() < deadline:
+            time.sleep(interval)
+            finished = 0
+            for batch_id in {b for b, _ in pending}:
+                try:
+                    response = requests.get(self.result_query_url.format(batch_id=batch_id), headers=self.headers, timeout=30)
+                    result = response.json()
+                except Exception as e:
+                    logger.warning(f"查询MinerU批量任务状态异常: {e}")
+                    continue
+                if response.status_code != 200 or result.get("code") != 0:
+                    logger.warning(f"MinerU批量查询失败: {response.status_code}, {result.get('msg')}")
+                    continue
+                for extract_result in result["data"]["extract_result"]:
+                    url = pending.get((batch_id, extract_result.get("data_id")))
+                    state = extract_result.get("state")
+                    if url is None or state not in ("done", "failed"):
+                        continue
+                    del pending[(batch_id, extract_result.get("data_id"))]
+                    finished += 1
+                    if state == "done" and extract_result.get("full_zip_url"):
+                        logger.debug(f"MinerU任务完成: {url}")
+                        on_done(url, extract_result["full_zip_url"])
+                    else:
+                        logger.error(f"MinerU任务失败: {url} - {extract_result.get('err_msg', '缺少下载链接')}")
+                        on_done(url, None)
+            interval = min_interval if finished else min(interval * 1.5, max_interval)
+            logger.debug(f"MinerU批量任务: {len(pending)} 个文件处理中，{interval:.0f} 秒后再次查询")
+
+        for url in pending.values():
+            logger.error(f"MinerU任务处理超时: {url}")
+            on_done(url, None)
+
+    def _download_and_extract_images(self, zip_url: str, max_images: int) -> List[Dict]:
+        """
+        下载zip文件并提取图片：下载内容暂存在内存（过大时溢出到临时文件），只读取zip的目录，
+        按大小选出前N张图片解码到内存，不解压其余文件，也不写入磁盘
+        """
         try:
-            # 下载zip文件
             response = requests.get(zip_url, stream=True, timeout=300)
             response.raise_for_status()
 
-            zip_path = Path(output_dir) / "mineru_result.zip"
-            with open(zip_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-            # 解压并提取图片
-            extracted_images = []
-            images_dir = Path(output_dir) / "extracted_images"
-            images_dir.mkdir(exist_ok=True)
-
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(output_dir)
-
-                # 首先获取所有文件信息用于排序和筛选
-                all_files = zip_ref.infolist()
-                image_files = []
-
-                # 收集所有图片文件
-                for file_info in all_files:
-                    file_path = Path(file_info.filename)
-                    if file_path.suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']:
-                        # 检查文件大小，过滤太小的图片（可能是装饰性图片）
-                        if file_info.file_size < 2000:  # 小于2KB的图片跳过
+            spool_size = int(os.getenv('MINERU_SPOOL_MAX_BYTES', str(64 * 1024 * 1024)))
+            with SpooledTemporaryFile(max_size=spool_size) as spool:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    spool.write(chunk)
+                spool.seek(0)
+
+                extracted_images = []
+                with zipfile.ZipFile(spool, 'r') as zip_ref:
+                    # 只根据中央目录中的文件信息排序和筛选
+                    image_files = [
+                        info for info in zip_ref.infolist()
+                        if Path(info.filename).suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp']
+                        # 小于2KB的图片跳过（可能是装饰性图片）
+                        and info.file_size >= 2000
+                    ]
+                    # 按文件大小排序，优先选择大图片
+                    image_files.sort(key=lambda info: info.file_size, reverse=True)
+
+                    # 多读取一些候选，经本地预筛选（去掉小图、logo、空白和近似重复）后再保留前N张
+                    candidate_factor = int(os.getenv('IMAGE_PREFILTER_CANDIDATES', '3'))
+                    for file_info in image_files[:max_images * candidate_factor]:
+                        file_path = Path(file_info.filename)
+                        try:
+                            data = zip_ref.read(file_info)
+                        except Exception as e:
+                            logger.warning(f"提取图片失败 {file_path}: {e}")
                             continue
-
-                        image_files.append((file_info, file_info.file_size))
-
-                # 按文件大小排序，优先选择大图片
-                image_files.sort(key=lambda x: x[1], reverse=True)
-
-                # 提取前N张最大的图片
-                for idx, (file_info, file_size) in enumerate(image_files[:max_images]):
-                    file_path = Path(file_info.filename)
-
-                    # 提取图片到指定目录
-                    original_name = file_path.name
-                    extension = file_path.suffix.lower()
-                    image_name = f"key_image_{idx + 1}{extension}"
-                    target_path = images_dir / image_name
-
-                    try:
-                        with zip_ref.open(file_info) as source, open(target_path, 'wb') as target:
-                            target.write(source.read())
-
-                        logger.debug(f"成功提取图片: {image_name} (来源: {file_path}, 大小: {file_size} 字节)")
-
                         extracted_images.append({
-                            'original_name': original_name,
-                            'extracted_name': image_name,
-                            'path': str(target_path),
-                            'size': file_size,
+                            'original_name': file_path.name,
+                            'data': data,
+                            'size': file_info.file_size,
                             'score': None,  # 稍后由Qwen3-VL评分
                             'description': None  # 稍后由Qwen3-VL描述
                         })
 
-                    except Exception as e:
-                        logger.warning(f"提取图片失败 {file_path}: {e}")
-                        continue
-
-            # 删除zip文件节省空间
-            zip_path.unlink(missing_ok=True)
+            extracted_images = prefilter_images(extracted_images, read_image_bytes, max_images)
+            for idx, img in enumerate(extracted_images):
+                img['extracted_name'] = f"key_image_{idx + 1}{Path(img['original_name']).suffix.lower()}"
 
-            logger.info(f"成功提取 {len(extracted_images)} 张图片到 {images_dir}")
+            logger.info(f"成功提取 {len(extracted_images)} 张图片（内存中）")
             for i, img in enumerate(extracted_images):
                 logger.debug(f"  {i+1}. {img['extracted_name']} - {img['size']} 字节")
 
@@ -245,6 +305,48 @@ class MinerUExtractor:
             return []
 
 
+SCORING_SYSTEM_PROMPT = """你是一个专业的学术论文图片分析助手。请分析给定的图片，评估其在学术论文中的重要性和代表性。
+
+评分标准（1-10分）：
+- 9-10分：核心结果图，展示了论文的主要贡献和关键发现
+- 7-8分：重要的实验结果或架构图，对理解论文有帮助
+- 5-6分：辅助性图表，提供支持性信息
+- 3-4分：一般性图示，装饰性或次要内容
+- 1-2分：不重要的图片，与论文主旨关系不大
+
+请为每张图片：
+1. 简要描述图片内容
+2. 评估其重要性并给出分数（1-10）
+3. 说明评分理由
+
+输出格式（严格JSON格式）：
+{
+    "description": "图片内容描述",
+    "score": 数字分数,
+    "reason": "评分理由"
+}"""
+
+
+def _parse_json(text: str):
+    """解析模型输出的 JSON，兼容 ```json 代码块包裹"""
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', text.strip())
+    return json.loads(text)
+
+
+def _parse_score(result) -> Dict:
+    """校验单张图片的评分结果，返回 description / score / reason；格式不对时抛出 ValueError"""
+    if not isinstance(result, dict):
+        raise ValueError(f"expected a JSON object, got: {result!r}")
+    score = result.get('score', 5)
+    if isinstance(score, str):
+        score = score.strip()
+        score = int(score) if score.isdigit() else float(score) if re.fullmatch(r'\d+\.\d+', score) else score
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        raise ValueError(f"non-numeric score: {score!r}")
+    return {'description': str(result.get('description', '')), 'score': score,
+            'reason': str(result.get('reason', ''))}
+
+
 class Qwen3VLImageScorer:
     """Qwen3-VL图片评分器"""
 
@@ -252,11 +354,16 @@ class Qwen3VLImageScorer:
                  model_id: str = "Qwen/Qwen3-VL-8B-Instruct"):
         self.client = OpenAI(
             api_key=api_key,
-            base_url=base_url
+            base_url=base_url,
+            max_retries=0
         )
         self.model_id = model_id
+        # 同一接口的评分请求共享并发控制，按 429 和延迟自适应调整
+        self.controller = get_controller(f"qwen-vl:{base_url}")
+        self.use_cache = True
 
-    def score_images(self, images: List[Dict], paper_title: str, paper_abstract: str) -> List[Dict]:
+    def score_images(self, images: List[Dict], paper_title: str, paper_abstract: str,
+                     mode: Optional[str] = None) -> List[Dict]:
         """
         对图片进行重要性评分和描述
 
@@ -264,6 +371,10 @@ class Qwen3VLImageScorer:
             images: 图片信息列表
             paper_title: 论文标题
             paper_abstract: 论文摘要
+            mode: 评分方式，默认读取 QWEN_SCORING_MODE：
+                concurrent - 每张图片一个请求，并发发送（默认）
+                multi - 所有图片放在一个多图请求中，返回 JSON 数组，解析失败时回退到 concurrent
+                sequential - 逐张请求
 
         Returns:
             List[Dict]: 更新后的图片信息列表，包含分数和描述
@@ -271,99 +382,176 @@ class Qwen3VLImageScorer:
         if not images:
             return images
 
-        logger.debug(f"开始使用Qwen3-VL评分 {len(images)} 张图片")
-
-        # 构建评分提示
-        system_prompt = """你是一个专业的学术论文图片分析助手。请分析给定的图片，评估其在学术论文中的重要性和代表性。
-
-评分标准（1-10分）：
-- 9-10分：核心结果图，展示了论文的主要贡献和关键发现
-- 7-8分：重要的实验结果或架构图，对理解论文有帮助
-- 5-6分：辅助性图表，提供支持性信息
-- 3-4分：一般性图示，装饰性或次要内容
-- 1-2分：不重要的图片，与论文主旨关系不大
-
-请为每张图片：
-1. 简要描述图片内容
-2. 评估其重要性并给出分数（1-10）
-3. 说明评分理由
-
-输出格式（严格JSON格式）：
-{
-    "description": "图片内容描述",
-    "score": 数字分数,
-    "reason": "评分理由"
-}"""
+        mode = (mode or os.getenv('QWEN_SCORING_MODE', 'concurrent')).lower()
+        logger.debug(f"开始使用Qwen3-VL评分 {len(images)} 张图片（{mode}）")
+        start = time.monotonic()
 
         user_prompt = f"""论文标题：{paper_title}
 论文摘要：{paper_abstract[:800]}...
 
 请分析以下图片在该论文中的重要性。"""
 
-        # 对每张图片进行评分
-        for i, image in enumerate(images):
+        vision_cache = get_cache('vision') if self.use_cache else None
+
+        # 每张图片只编码一次；与 overview_figure 共用 vision 缓存，相同图片、prompt 和模型不再重复评分
+        pending = []
+        for image in images:
             try:
-                image_path = image['path']
-                if not os.path.exists(image_path):
-                    logger.warning(f"图片文件不存在: {image_path}")
+                if image.get('data') is None and not os.path.exists(image['path']):
+                    logger.warning(f"图片文件不存在: {image['path']}")
                     continue
+                image_data_url = self._image_to_data_url(image)
+            except Exception as e:
+                logger.error(f"图片 {image['extracted_name']} 读取失败: {e}")
+                self._set_failed(image, e)
+                continue
+            cache_key = DiskCache.key(image_data_url, SCORING_SYSTEM_PROMPT, user_prompt, self.model_id)
+            cached = vision_cache.get(cache_key) if vision_cache else None
+            if cached is not None:
+                image.update(cached)
+                logger.debug(f"图片 {image['extracted_name']} 使用缓存评分: {image['score']}/10")
+                continue
+            pending.append((image, image_data_url, cache_key))
+
+        single = pending
+        if mode == 'multi' and len(pending) > 1 and self._score_multi(pending, user_prompt, vision_cache):
+            single = []
+        workers = 1 if mode == 'sequential' else int(os.getenv('QWEN_SCORE_CONCURRENCY', '4'))
+        score = lambda item: self._score_single(*item, user_prompt, vision_cache)
+        if workers > 1 and len(single) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(score, single))
+        else:
+            for item in single:
+                score(item)
 
-                # 将图片转为base64
-                image_data_url = self._image_to_data_url(image_path)
-
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": user_prompt},
-                        {"type": "image_url", "image_url": {"url": image_data_url}}
-                    ]}
-                ]
-
-                response = self.client.chat.completions.create(
-                    model=self.model_id,
-                    messages=messages,
-                    stream=False,
-                    max_tokens=500,
-                    temperature=0.1
-                )
+        # 按分数排序
+        images.sort(key=lambda x: x.get('score', 0) or 0, reverse=True)
+        logger.debug(f"图片评分完成（{mode}，{len(pending)} 次未命中缓存），耗时 {time.monotonic() - start:.1f}s，"
+                     f"最高分: {images[0].get('score', 0) if images else 0}")
 
-                response_text = response.choices[0].message.content.strip()
+        return images
 
-                # 解析JSON响应
+    def _create(self, messages: List[Dict], max_tokens: int):
+        """
+        在共享的自适应并发控制器下发送请求：429 时按服务端要求等待后重试；
+        超时、连接错误和 5xx 按指数退避重试，重试耗尽后才计入熔断器
+        """
+        max_attempts = int(os.getenv('QWEN_MAX_RETRIES', '3'))
+        for attempt in range(max_attempts):
+            with self.controller.slot():
+                start = time.monotonic()
                 try:
-                    result = json.loads(response_text)
-                    image['description'] = result.get('description', '')
-                    image['score'] = result.get('score', 5)
-                    image['reason'] = result.get('reason', '')
-                    logger.debug(f"图片 {image['extracted_name']} 评分: {image['score']}/10")
-                except json.JSONDecodeError:
-                    logger.warning(f"无法解析Qwen3-VL响应: {response_text}")
-                    # 给予默认分数
-                    image['description'] = response_text
-                    image['score'] = 5
-                    image['reason'] = 'API响应解析失败'
-
-                # 添加延迟避免API限制
-                time.sleep(2)
-
-            except Exception as e:
-                logger.error(f"图片 {image['extracted_name']} 评分失败: {e}")
+                    raw = self.client.chat.completions.with_raw_response.create(
+                        model=self.model_id,
+                        messages=messages,
+                        stream=False,
+                        max_tokens=max_tokens,
+                        temperature=0.1
+                    )
+                except RateLimitError as e:
+                    wait = self.controller.on_rate_limited(e.response.headers)
+                    error = e
+                except (APIConnectionError, InternalServerError) as e:
+                    # APITimeoutError 是 APIConnectionError 的子类
+                    response = getattr(e, 'response', None)
+                    wait = wait_time_from_headers(getattr(response, 'headers', None)) or 2 * (2 ** attempt)
+                    logger.debug(f"Qwen3-VL请求失败（第 {attempt + 1} 次）：{type(e).__name__}: {e}")
+                    error = e
+                except Exception:
+                    self.controller.on_failure()
+                    raise
+                else:
+                    self.controller.on_success(time.monotonic() - start, raw.headers)
+                    return raw.parse()
+            if attempt < max_attempts - 1:
+                time.sleep(wait)
+        self.controller.on_failure()
+        if isinstance(error, RateLimitError):
+            raise RuntimeError("Qwen3-VL请求被持续限流") from error
+        raise error
+
+    def _score_single(self, image: Dict, image_data_url: str, cache_key: str, user_prompt: str,
+                      vision_cache: Optional[DiskCache]):
+        """单张图片评分"""
+        try:
+            messages = [
+                {"role": "system", "content": SCORING_SYSTEM_PROMPT},
+                {"role": "user", "content": [
+                    {"type": "text", "text": user_prompt},
+                    {"type": "image_url", "image_url": {"url": image_data_url}}
+                ]}
+            ]
+            response_text = self._create(messages, max_tokens=500).choices[0].message.content.strip()
+
+            # 解析JSON响应
+            try:
+                result = _parse_score(_parse_json(response_text))
+                image.update(result)
+                logger.debug(f"图片 {image['extracted_name']} 评分: {image['score']}/10")
+                if vision_cache:
+                    vision_cache.set(cache_key, result)
+            except ValueError:
+                logger.warning(f"无法解析Qwen3-VL响应: {response_text}")
                 # 给予默认分数
-                image['description'] = f"评分失败: {str(e)}"
-                image['score'] = 3
-                image['reason'] = 'API调用失败'
-
-        # 按分数排序
-        images.sort(key=lambda x: x.get('score', 0), reverse=True)
-        logger.debug(f"图片评分完成，最高分: {images[0].get('score', 0) if images else 0}")
+                image['description'] = response_text
+                image['score'] = 5
+                image['reason'] = 'API响应解析失败'
+                # 与调用失败一样视为评分失败，整篇论文的结果不作为否定结果缓存
+                image['scoring_failed'] = True
 
-        return images
+        except Exception as e:
+            logger.error(f"图片 {image['extracted_name']} 评分失败: {e}")
+            self._set_failed(image, e)
 
-    def _image_to_data_url(self, image_path: str) -> str:
-        """将本地图片转为data URL"""
-        with open(image_path, "rb") as image_file:
-            encoded = base64.b64encode(image_file.read()).decode("utf-8")
-        return f"data:image/jpeg;base64,{encoded}"
+    def _score_multi(self, pending: List[Tuple[Dict, str, str]], user_prompt: str,
+                     vision_cache: Optional[DiskCache]) -> bool:
+        """
+        多图评分：所有图片放在一个请求中，要求按顺序返回 JSON 数组。
+        缓存仍按单张图片的键写入，与单图模式的结果可以互相复用。
+        :return: 是否成功解析出全部图片的结果
+        """
+        content = [{"type": "text", "text": user_prompt +
+                    f"\n\n共有 {len(pending)} 张图片，按顺序编号为 1 到 {len(pending)}。"
+                    "请输出一个 JSON 数组，按图片顺序每张图片一个对象，格式同上，并增加 \"index\" 字段。"}]
+        for idx, (_, image_data_url, _) in enumerate(pending, 1):
+            content.append({"type": "text", "text": f"图片 {idx}："})
+            content.append({"type": "image_url", "image_url": {"url": image_data_url}})
+        messages = [
+            {"role": "system", "content": SCORING_SYSTEM_PROMPT},
+            {"role": "user", "content": content}
+        ]
+        try:
+            response_text = self._create(messages, max_tokens=300 * len(pending)).choices[0].message.content.strip()
+            results = _parse_json(response_text)
+            if not isinstance(results, list) or len(results) != len(pending):
+                raise ValueError(f"expected {len(pending)} results, got: {response_text[:200]}")
+            if all(isinstance(r, dict) and isinstance(r.get('index'), int) for r in results):
+                results = sorted(results, key=lambda r: r['index'])
+            results = [_parse_score(r) for r in results]
+        except Exception as e:
+            logger.warning(f"Qwen3-VL多图评分失败，回退到逐张评分: {e}")
+            return False
+
+        for (image, _, cache_key), result in zip(pending, results):
+            image.update(result)
+            logger.debug(f"图片 {image['extracted_name']} 评分: {image['score']}/10")
+            if vision_cache:
+                vision_cache.set(cache_key, result)
+        return True
+
+    @staticmethod
+    def _set_failed(image: Dict, error: Exception):
+        # 给予默认分数
+        image['description'] = f"评分失败: {str(error)}"
+        image['score'] = 3
+        image['reason'] = 'API调用失败'
+        image['scoring_failed'] = True
+
+    def _image_to_data_url(self, image: Dict) -> str:
+        """将图片缩放、重新编码后转为data URL"""
+        encoded, mime_type = encode_image(read_image_bytes(image))
+        return f"data:{mime_type};base64,{encoded}"
 
     def get_top_image(self, images: List[Dict], min_score: int = 6) -> Optional[Dict]:
         """
@@ -429,12 +617,11 @@ class ImageAnalyzer:
         self.mineru = MinerUExtractor(mineru_token, mineru_api_url)
         self.qwen_scorer = Qwen3VLImageScorer(qwen_api_key, qwen_base_url, qwen_model)
 
-        # 创建永久目录存储图片
-        self.image_storage_dir = Path(os.getcwd()) / "extracted_images"
-        self.image_storage_dir.mkdir(exist_ok=True)
+        # 按论文和内容哈希存放关键图片，不同论文可以并行处理
+        self.image_store = get_image_store()
 
     def extract_and_score_images(self, pdf_url: str, paper_title: str,
-                               paper_abstract: str, max_images: int = 10) -> Optional[Dict]:
+                               paper_abstract: str, max_images: int = 10, paper_id: str = None) -> Optional[Dict]:
         """
         提取图片并评分，返回最重要的图片（保持向后兼容的单张图片接口）
 
@@ -447,14 +634,16 @@ class ImageAnalyzer:
         Returns:
             Optional[Dict]: 最重要图片的信息，包含base64编码用于邮件显示
         """
-        result = self.extract_and_score_multiple_images(pdf_url, paper_title, paper_abstract, max_images, top_k=1)
+        result = self.extract_and_score_multiple_images(pdf_url, paper_title, paper_abstract, max_images, top_k=1,
+                                                        paper_id=paper_id)
         if result and result.get('images'):
             return result['images'][0]  # 返回第一张（最重要的）图片
         return None
 
     def extract_and_score_multiple_images(self, pdf_url: str, paper_title: str,
                                          paper_abstract: str, max_images: int = 10,
-                                         top_k: int = 3, cleanup_after: bool = False) -> Optional[Dict]:
+                                         top_k: int = 3, cleanup_after: bool = False,
+                                         paper_id: str = None, paper_version: str = None) -> Optional[Dict]:
         """
         提取图片并评分，返回最重要的前K张图片
 
@@ -465,10 +654,16 @@ class ImageAnalyzer:
             max_images: 最大提取图片数
             top_k: 需要返回的图片数量
             cleanup_after: 处理完成后是否清理图片文件
+            paper_id: 论文ID（如 arxiv_id），用于图片存储的目录，默认取 PDF 文件名
+            paper_version: 论文版本（如 v2），与 paper_id 一起作为结果缓存的键
 
         Returns:
             Optional[Dict]: 包含重要图片列表的信息
         """
+        cache_key = self._result_cache_key(paper_id, paper_version, max_images, top_k)
+        cached = self._load_cached_result(cache_key, paper_id)
+        if cached is not None:
+            return cached if cached['images'] else None
         try:
             # 步骤1: 使用MinerU提取图片
             images = self.mineru.extract_images_from_pdf(pdf_url, max_images)
@@ -476,6 +671,113 @@ class ImageAnalyzer:
                 logger.debug("未能提取到任何图片")
                 return None
 
+            result = self._score_and_select(images, paper_id or pdf_url.rstrip('/').split('/')[-1],
+                                            paper_title, paper_abstract, top_k, cleanup_after)
+            self._save_result(cache_key, result)
+            return result if result and result['images'] else None
+
+        except Exception as e:
+            logger.error(f"图片提取和评分过程失败: {e}")
+            return None
+
+    def extract_and_score_batch(self, papers: List[Dict], max_images: int = 10, top_k: int = 3,
+                                timeout: float = 900) -> Dict[str, Optional[Dict]]:
+        """
+        批量模式：所有PDF在一个MinerU任务中提交，每篇论文的结果一完成就交给评分线程处理
+
+        Args:
+            papers: 论文列表，每项包含 pdf_url、title、abstract，可选 arxiv_id、version（用于结果缓存）
+            max_images: 每篇论文最大提取图片数
+            top_k: 每篇论文需要返回的图片数量
+            timeout: MinerU整体超时时间（秒）
+
+        Returns:
+            Dict[str, Optional[Dict]]: pdf_url -> 与 extract_and_score_multiple_images 相同格式的结果
+        """
+        info = {p['pdf_url']: p for p in papers}
+        results = {url: None for url in info}
+        futures = []
+        cache_keys = {url: self._result_cache_key(p.get('arxiv_id'), p.get('version'), max_images, top_k)
+                      for url, p in info.items()}
+        # 命中缓存的论文不再提交给MinerU
+        for url, p in info.items():
+            results[url] = self._load_cached_result(cache_keys[url], p.get('arxiv_id'))
+        to_submit = [url for url, result in results.items() if result is None]
+        if len(to_submit) < len(info):
+            logger.info(f"MinerU结果缓存命中 {len(info) - len(to_submit)}/{len(info)} 篇论文")
+
+        def process(pdf_url: str, zip_url: str):
+            paper = info[pdf_url]
+            images = self.mineru._download_and_extract_images(zip_url, max_images)
+            if images:
+                paper_id = paper.get('arxiv_id') or pdf_url.rstrip('/').split('/')[-1]
+                results[pdf_url] = self._score_and_select(images, paper_id, paper['title'], paper['abstract'], top_k)
+                self._save_result(cache_keys[pdf_url], results[pdf_url])
+
+        with ThreadPoolExecutor(max_workers=int(os.getenv('MINERU_SCORE_WORKERS', '4'))) as executor:
+            def on_done(pdf_url: str, zip_url: Optional[str]):
+                if zip_url is not None:
+                    futures.append(executor.submit(process, pdf_url, zip_url))
+            if to_submit:
+                self.mineru.extract_batch(to_submit, on_done, timeout=timeout)
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"图片提取和评分过程失败: {e}")
+        # 没有满足条件图片的结果（images 为空）只用于缓存，对外与失败一样返回 None
+        results = {url: result if result and result['images'] else None for url, result in results.items()}
+        logger.info(f"MinerU批量模式完成: {sum(r is not None for r in results.values())}/{len(results)} 篇论文找到关键图片")
+        return results
+
+    def _result_cache_key(self, paper_id: Optional[str], paper_version: Optional[str],
+                          max_images: int, top_k: int) -> Optional[str]:
+        """结果缓存的键：论文ID、版本、MinerU和评分模型及选择参数；没有论文ID时不缓存"""
+        if not paper_id:
+            return None
+        return DiskCache.key(paper_id, paper_version or '', self.mineru.model_version, self.qwen_scorer.model_id,
+                             max_images, top_k)
+
+    def _load_cached_result(self, cache_key: Optional[str], paper_id: Optional[str]) -> Optional[Dict]:
+        """
+        读取缓存的提取和评分结果，图片内容从图片存储中按哈希取回；
+        任意一张图片已被淘汰时视为未命中
+        """
+        if cache_key is None:
+            return None
+        cached = get_cache('mineru').get(cache_key)
+        if cached is None:
+            return None
+        if not cached['images']:
+            logger.debug(f"论文 {paper_id} 的缓存结果中没有满足条件的图片，跳过提取")
+            return cached
+        images = []
+        for img in cached['images']:
+            data = self.image_store.get(paper_id, img['sha256'])
+            if data is None:
+                logger.debug(f"论文 {paper_id} 的缓存图片已被淘汰，重新提取")
+                return None
+            image_base64, mime_type = encode_image(data)
+            images.append({**img, 'base64_data': image_base64, 'mime_type': mime_type})
+        logger.debug(f"论文 {paper_id} 使用缓存的关键图片结果（{len(images)} 张）")
+        return {**cached, 'images': images}
+
+    def _save_result(self, cache_key: Optional[str], result: Optional[Dict]):
+        """
+        缓存提取和评分结果（不含base64，图片本身保存在图片存储中）
+        没有满足条件图片的结果（images 为空）同样缓存，重复运行时不再提交给 MinerU；None（失败）不缓存
+        """
+        if cache_key is None or result is None:
+            return
+        get_cache('mineru').set(cache_key, {
+            **result,
+            'images': [{k: v for k, v in img.items() if k != 'base64_data'} for img in result['images']],
+        })
+
+    def _score_and_select(self, images: List[Dict], paper_id: str, paper_title: str, paper_abstract: str,
+                          top_k: int, cleanup_after: bool = False) -> Optional[Dict]:
+        """对提取出的图片评分，返回最重要的前K张图片；没有满足条件的图片时 images 为空，评分失败时返回 None"""
+        try:
             # 步骤2: 使用Qwen3-VL对图片评分
             scored_images = self.qwen_scorer.score_images(images, paper_title, paper_abstract)
             if not scored_images:
@@ -486,18 +788,25 @@ class ImageAnalyzer:
             top_images = self.qwen_scorer.get_top_images(scored_images, top_k, min_score=6)
             if not top_images:
                 logger.debug(f"没有满足条件的图片，最高分: {scored_images[0].get('score', 0) if scored_images else 0}")
-                return None
+                if any(img.get('scoring_failed') for img in scored_images):
+                    # 部分图片评分失败（调用失败或响应无法解析），结果不可信，不作为否定结果缓存
+                    return None
+                return {'images': [], 'count': 0, 'total_extracted': len(images)}
 
             # 步骤4: 将图片转为base64用于邮件显示
             processed_images = []
             for img in top_images:
-                image_base64 = self._image_to_base64(img['path'])
+                image_base64, mime_type = self._image_to_base64(img)
+                digest, path = self.image_store.put(paper_id, read_image_bytes(img), Path(img['extracted_name']).suffix)
                 processed_images.append({
                     'filename': img['extracted_name'],
+                    'path': str(path),
+                    'sha256': digest,
                     'description': img.get('description', ''),
                     'score': img.get('score', 0),
                     'reason': img.get('reason', ''),
                     'base64_data': image_base64,
+                    'mime_type': mime_type,
                     'size': img.get('size', 0)
                 })
 
@@ -519,20 +828,15 @@ class ImageAnalyzer:
             logger.error(f"图片提取和评分过程失败: {e}")
             return None
 
-    def _image_to_base64(self, image_path: str) -> str:
-        """将图片转为base64字符串"""
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
+    def _image_to_base64(self, image: Dict) -> Tuple[str, str]:
+        """将图片缩放、重新编码后转为base64字符串，返回 (base64, MIME 类型)"""
+        return encode_image(read_image_bytes(image))
 
     def cleanup(self):
         """手动清理图片文件（可选）"""
         try:
-            if self.image_storage_dir.exists():
-                # 可选择删除图片文件，但保留目录
-                for file in self.image_storage_dir.glob("*"):
-                    if file.is_file():
-                        file.unlink()
-                logger.debug("图片文件已清理")
+            self.image_store.clear()
+            logger.debug("图片文件已清理")
         except Exception as e:
             logger.error(f"清理图片文件失败: {e}")
 
@@ -564,4 +868,72 @@ def get_image_analyzer(mineru_token: str = None, qwen_api_key: str = None) -> Im
 
         _global_image_analyzer = ImageAnalyzer(mineru_token, qwen_api_key)
 
-    return _global_image_analyzer
\ No newline at end of file
+    return _global_image_analyzer
+
+
+def _score_images_legacy(scorer: Qwen3VLImageScorer, images: List[Dict], paper_title: str, paper_abstract: str):
+    """
+    改为并发评分之前的逐张评分循环，仅用于基准对比：每张图片在循环内读取编码，
+    直接调用接口（不经过并发控制器和重试），每次请求后固定等待 2 秒
+    """
+    user_prompt = f"""论文标题：{paper_title}
+论文摘要：{paper_abstract[:800]}...
+
+请分析以下图片在该论文中的重要性。"""
+    for image in images:
+        try:
+            messages = [
+                {"role": "system", "content": SCORING_SYSTEM_PROMPT},
+                {"role": "user", "content": [
+                    {"type": "text", "text": user_prompt},
+                    {"type": "image_url", "image_url": {"url": scorer._image_to_data_url(image)}}
+                ]}
+            ]
+            response = scorer.client.chat.completions.create(
+                model=scorer.model_id,
+                messages=messages,
+                stream=False,
+                max_tokens=500,
+                temperature=0.1
+            )
+            try:
+                image.update(_parse_score(_parse_json(response.choices[0].message.content.strip())))
+            except ValueError:
+                image['score'] = 5
+            time.sleep(2)
+        except Exception as e:
+            logger.error(f"图片 {image['extracted_name']} 评分失败: {e}")
+            image['score'] = 3
+
+
+def benchmark_scoring(image_paths: List[str], paper_title: str, paper_abstract: str,
+                      modes: List[str] = ('legacy', 'sequential', 'concurrent', 'multi')):
+    """
+    对同一组图片比较不同评分方式的耗时（不使用缓存）
+    legacy 为改动前的循环（逐张读取编码、每次请求后等待 2 秒），作为对比基准；
+    sequential 为当前实现的逐张模式（预先编码、只在 429 时等待）
+    """
+    scorer = Qwen3VLImageScorer(os.getenv('QWEN_API_KEY'),
+                                os.getenv('QWEN_BASE_URL', 'https://api-inference.modelscope.cn/v1/'),
+                                os.getenv('QWEN_MODEL', 'Qwen/Qwen3-VL-8B-Instruct'))
+    scorer.use_cache = False
+    print(f"{'mode':>12} {'seconds':>8} {'scores':>20}")
+    for mode in modes:
+        images = [{'extracted_name': Path(p).name, 'path': p} for p in image_paths]
+        start = time.monotonic()
+        if mode == 'legacy':
+            _score_images_legacy(scorer, images, paper_title, paper_abstract)
+        else:
+            scorer.score_images(images, paper_title, paper_abstract, mode=mode)
+        scores = [img.get('score') for img in sorted(images, key=lambda x: x['extracted_name'])]
+        print(f"{mode:>12} {time.monotonic() - start:>8.1f} {str(scores):>20}")
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark Qwen3-VL image scoring modes')
+    parser.add_argument('images', nargs='+', help='Image files to score')
+    parser.add_argument('--title', default='', help='Paper title')
+    parser.add_argument('--abstract', default='', help='Paper abstract')
+    args = parser.parse_args()
+    benchmark_scoring(args.images, args.title, args.abstract)
@@ -0,0 +1,139 @@
+"""
+按论文和内容哈希存放图片的本地存储
+
+路径为 {根目录}/{arxiv_id}/{sha256 前 16 位}{扩展名}：不同论文、不同图片互不覆盖，相同内容只存一份。
+写入先写临时文件再原子替换，多线程同时写同一张图片也不会读到半个文件；
+总大小超过预算时按最近访问时间（mtime）淘汰最旧的文件（只删除文件，不删除目录，避免与并发写入冲突）。
+"""
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Optional
+from loguru import logger
+
+
+class ImageStore:
+    """
+    内容寻址的图片存储，带字节预算的 LRU 淘汰
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        :param root: 存储根目录
+        :param max_bytes: 总字节预算，超过后淘汰最久未访问的图片
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None  # 首次写入时扫描目录得到
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _dir(self, arxiv_id: str) -> Path:
+        # arxiv_id 可能包含 '/'（旧格式，如 cs/0112017）
+        return self.root / re.sub(r'[^\w.\-]', '_', arxiv_id)
+
+    def _find(self, arxiv_id: str, digest: str) -> Optional[Path]:
+        directory = self._dir(arxiv_id)
+        if not directory.exists():
+            return None
+        return next(directory.glob(f"{digest[:16]}.*"), None)
+
+    def put(self, arxiv_id: str, data: bytes, suffix: str = '.png') -> tuple[str, Path]:
+        """
+        保存图片，返回 (内容哈希, 路径)；已存在时只刷新访问时间
+        """
+        digest = self.digest(data)
+        path = self._dir(arxiv_id) / f"{digest[:16]}{suffix.lower()}"
+        try:
+            os.utime(path)
+            return digest, path
+        except FileNotFoundError:
+            # 不存在，或刚被其他线程淘汰
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(dir=path.parent, prefix='.tmp-', delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan_total()
+            else:
+                self._total += len(data)
+            if self._total > self.max_bytes:
+                self._evict(keep=path)
+        return digest, path
+
+    def get(self, arxiv_id: str, digest: str) -> Optional[bytes]:
+        """按内容哈希读取图片，不存在（或已被淘汰）时返回 None"""
+        path = self._find(arxiv_id, digest)
+        if path is None:
+            return None
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def _files(self) -> list[Path]:
+        return [p for p in self.root.glob('*/*') if p.is_file() and not p.name.startswith('.tmp-')]
+
+    def _scan_total(self) -> int:
+        total = 0
+        for p in self._files():
+            try:
+                total += p.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _evict(self, keep: Path):
+        """按 mtime 从旧到新删除文件，直到总大小回到预算的 90%"""
+        entries = []
+        for p in self._files():
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+        entries.sort()
+        self._total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for _, size, p in entries:
+            if self._total <= target:
+                break
+            if p == keep:
+                continue
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            self._total -= size
+            evicted += 1
+            # 不删除空的论文目录：其他线程可能正在向其中写入
+        logger.debug(f"Image store evicted {evicted} files, {self._total / 1024 / 1024:.1f}MB remaining")
+
+    def clear(self):
+        """删除所有图片（保留根目录）"""
+        with self._lock:
+            for p in self._files():
+                p.unlink(missing_ok=True)
+            self._total = 0
+
+
+GLOBAL_IMAGE_STORE = None
+
+
+def get_image_store() -> ImageStore:
+    global GLOBAL_IMAGE_STORE
+    if GLOBAL_IMAGE_STORE is None:
+        GLOBAL_IMAGE_STORE = ImageStore(os.getenv('IMAGE_STORE_DIR', 'extracted_images'),
+                                        int(os.getenv('IMAGE_STORE_MAX_BYTES', str(200 * 1024 * 1024))))
+    return GLOBAL_IMAGE_STORE
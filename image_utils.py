@@ -0,0 +1,180 @@
+"""
+图片负载优化
+
+送入 vision LLM 和嵌入邮件之前统一处理图片：按长边缩放、去掉元数据、转为 JPEG / WebP，
+并在超过字节上限时逐步降低质量和尺寸。论文插图原图常有数 MB，缩放后通常只有几十 KB。
+另外提供基于尺寸、熵、留白比例和感知哈希的候选图片预筛选。
+"""
+import base64
+import io
+import math
+import os
+from typing import Callable, Optional
+from loguru import logger
+from PIL import Image
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png', 'GIF': 'image/gif'}
+
+
+def guess_mime_type(data: bytes) -> str:
+    """根据文件头判断图片类型，无法识别时按 PNG 处理"""
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return 'image/png'
+
+
+def _encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    # 不传 exif / icc_profile，元数据不会写入输出
+    if image_format == 'PNG':
+        image.save(buffer, format='PNG', optimize=True)
+    else:
+        image.save(buffer, format=image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def normalize_image(data: bytes, max_edge: Optional[int] = None, image_format: Optional[str] = None,
+                    quality: Optional[int] = None, max_bytes: Optional[int] = None) -> tuple[bytes, str]:
+    """
+    缩放并重新编码图片
+    线稿、色块组成的架构图用 PNG 往往比 JPEG 更小且没有压缩伪影，因此同时尝试 PNG，取较小的结果；
+    原图尺寸和大小都符合要求且不大于重新编码的结果时，保留原图
+    :param max_edge: 长边像素上限，默认读取 IMAGE_MAX_EDGE
+    :param image_format: 输出格式 jpeg / webp / png，默认读取 IMAGE_FORMAT
+    :param quality: 初始编码质量，默认读取 IMAGE_QUALITY
+    :param max_bytes: 输出字节上限，默认读取 IMAGE_MAX_BYTES，超过时降低质量和尺寸
+    :return: (图片字节, MIME 类型)；无法解码时原样返回
+    """
+    max_edge = max_edge or int(os.getenv('IMAGE_MAX_EDGE', '1280'))
+    image_format = (image_format or os.getenv('IMAGE_FORMAT', 'jpeg')).upper().replace('JPG', 'JPEG')
+    quality = quality or int(os.getenv('IMAGE_QUALITY', '80'))
+    max_bytes = max_bytes or int(os.getenv('IMAGE_MAX_BYTES', '200000'))
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        logger.debug(f"Cannot decode image for normalization, keeping original bytes: {e}")
+        return data, guess_mime_type(data)
+    original_format = image.format
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # 透明背景铺白底，避免 JPEG 中透明区域变黑
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    resized = max(image.size) > max_edge
+    if resized:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    formats = [image_format] if image_format == 'PNG' else [image_format, 'PNG']
+    output, chosen = min(((_encode(image, f, quality), f) for f in formats), key=lambda x: len(x[0]))
+    if (not resized and original_format in MIME_TYPES and len(data) <= min(len(output), max_bytes)):
+        logger.debug(f"Keeping original {original_format} image ({len(data) / 1024:.0f}KB), re-encoding would not shrink it")
+        return data, MIME_TYPES[original_format]
+
+    while len(output) > max_bytes and max(image.size) > 256:
+        if chosen != image_format:
+            # 无损 PNG 超过上限时改用有损格式
+            chosen = image_format
+        elif chosen != 'PNG' and quality > 50:
+            quality -= 10
+        else:
+            image = image.resize((max(1, int(image.width * 0.8)), max(1, int(image.height * 0.8))), Image.LANCZOS)
+        output = _encode(image, chosen, quality)
+
+    logger.debug(f"Normalized image {len(data) / 1024:.0f}KB -> {len(output) / 1024:.0f}KB "
+                 f"({image.width}x{image.height} {chosen}, quality {quality})")
+    return output, MIME_TYPES.get(chosen, 'image/png')
+
+
+def encode_image(data: bytes) -> tuple[str, str]:
+    """
+    规范化图片并转为 base64
+    :return: (base64 字符串, MIME 类型)
+    """
+    data, mime_type = normalize_image(data)
+    return base64.b64encode(data).decode('utf-8'), mime_type
+
+
+def image_features(data: bytes) -> Optional[dict]:
+    """
+    计算用于预筛选的廉价特征：尺寸、长宽比、灰度熵、留白比例和感知哈希（dHash）
+    无法解码时返回 None
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+        # JPEG 可以直接以缩小的尺寸解码
+        image.draft('L', (256, 256))
+        gray = image.convert('L')
+    except Exception:
+        return None
+    small = gray.copy()
+    small.thumbnail((256, 256))
+    histogram = small.histogram()
+    total = sum(histogram) or 1
+    entropy = -sum(c / total * math.log2(c / total) for c in histogram if c)
+    whitespace = sum(histogram[240:]) / total
+    # dHash：缩放到 9x8 后比较相邻像素
+    pixels = list(gray.resize((9, 8), Image.LANCZOS).getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            dhash = dhash << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return {
+        'width': width,
+        'height': height,
+        'aspect': width / max(height, 1),
+        'entropy': entropy,
+        'whitespace': whitespace,
+        'dhash': dhash,
+    }
+
+
+def prefilter_images(images: list[dict], read: Callable[[dict], bytes], max_images: int,
+                     min_edge: int = 150, max_aspect: float = 5.0, min_entropy: float = 1.5,
+                     max_whitespace: float = 0.98, min_background: float = 0.5,
+                     max_hash_distance: int = 6) -> list[dict]:
+    """
+    在调用 vision 模型之前过滤候选图片：去掉过小、过于细长、近乎空白或颜色单一（logo、装饰）的图片，
+    并按感知哈希去掉近似重复的图片（保留排在前面的一张）
+    白底黑线的架构图、折线图灰度熵也很低，因此只有低熵且没有白色背景（留白比例低于 min_background）的
+    图片才视为纯色装饰
+    :param images: 按优先级排序的候选图片
+    :param read: 读取图片字节的函数
+    :return: 保留的前 max_images 张图片
+    """
+    kept = []
+    dropped = {}
+    for image in images:
+        features = image_features(read(image))
+        if features is None:
+            reason = 'undecodable'
+        elif min(features['width'], features['height']) < min_edge:
+            reason = 'too small'
+        elif max(features['aspect'], 1 / max(features['aspect'], 1e-6)) > max_aspect:
+            reason = 'extreme aspect ratio'
+        elif features['whitespace'] > max_whitespace:
+            reason = 'mostly blank'
+        elif features['entropy'] < min_entropy and features['whitespace'] < min_background:
+            reason = 'flat colour'
+        elif any(bin(features['dhash'] ^ k['features']['dhash']).count('1') <= max_hash_distance for k in kept):
+            reason = 'near duplicate'
+        else:
+            kept.append({**image, 'features': features})
+            if len(kept) >= max_images:
+                break
+            continue
+        dropped[reason] = dropped.get(reason, 0) + 1
+    if dropped:
+        logger.debug(f"Image pre-filter kept {len(kept)} images, dropped {dropped}")
+    return kept
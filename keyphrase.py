@@ -0,0 +1,116 @@
+"""
+基于句向量的关键词标签（不调用 LLM）
+
+从标题、摘要和 introduction 中抽取 1-3 词的候选短语，与文档向量计算相似度，
+再用 MMR（Maximal Marginal Relevance）在相关性与多样性之间取舍。
+所有论文的文档和候选短语在一次 encode 调用中批量编码。
+"""
+import re
+from collections import Counter
+import numpy as np
+from loguru import logger
+from paper import ArxivPaper
+
+STOPWORDS = set("""
+a an and are as at be been being but by can could do does for from has have how however in into is it its
+itself may more most must not of on or our over such than that the their them then there these they this
+those through to under up upon via was we were what when where which while who whose why will with within
+without would you your also based both each either et al first further here new novel only other same
+several show shows shown some propose proposed proposes present presents paper approach method methods
+work results result using use used achieve achieves state art existing different various significantly
+well across many demonstrate demonstrates experiments extensive recent recently however moreover thus
+""".split())
+WORD = re.compile(r"[A-Za-z][A-Za-z0-9\-]*[A-Za-z0-9]|[A-Za-z]")
+
+
+def _plain_text(text: str) -> str:
+    """去掉 LaTeX 命令、公式和引用，保留正文"""
+    text = re.sub(r'\$[^$]*\$', ' ', text)
+    text = re.sub(r'\\(cite|ref|eqref|label|url|footnote)\w*\{[^{}]*\}', ' ', text)
+    text = re.sub(r'\\[a-zA-Z]+\*?', ' ', text)
+    return re.sub(r'[{}~%]', ' ', text)
+
+
+def candidate_phrases(text: str, max_ngram: int = 3, max_candidates: int = 60) -> list[str]:
+    """
+    按句子和标点切分后抽取 n-gram，首尾不能是停用词；按出现频次保留前 max_candidates 个
+    """
+    counts = Counter()
+    for chunk in re.split(r'[.,;:!?()\[\]"\n]', _plain_text(text)):
+        words = WORD.findall(chunk)
+        for n in range(1, max_ngram + 1):
+            for i in range(len(words) - n + 1):
+                gram = words[i:i + n]
+                if gram[0].lower() in STOPWORDS or gram[-1].lower() in STOPWORDS:
+                    continue
+                if n == 1 and (len(gram[0]) < 4 or gram[0].islower() and len(gram[0]) < 6):
+                    # 单个普通短词几乎不具备区分度
+                    continue
+                counts[" ".join(gram)] += 1
+    # 忽略大小写合并同一短语，保留最常见的写法
+    merged = {}
+    for phrase, count in counts.most_common():
+        key = phrase.lower()
+        if key not in merged:
+            merged[key] = [phrase, 0]
+        merged[key][1] += count
+    ranked = sorted(merged.values(), key=lambda x: (-x[1], -len(x[0].split())))
+    return [phrase for phrase, _ in ranked[:max_candidates]]
+
+
+def mmr(doc_embedding: np.ndarray, candidate_embeddings: np.ndarray, candidates: list[str],
+        top_k: int = 8, diversity: float = 0.5) -> list[str]:
+    """
+    Maximal Marginal Relevance：每次选择与文档最相关、且与已选短语最不相似的候选
+    :param diversity: 0 表示只看相关性，1 表示只看多样性
+    """
+    if not candidates:
+        return []
+    relevance = candidate_embeddings @ doc_embedding
+    similarity = candidate_embeddings @ candidate_embeddings.T
+    selected = [int(np.argmax(relevance))]
+    remaining = [i for i in range(len(candidates)) if i != selected[0]]
+    while remaining and len(selected) < top_k:
+        redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        scores = (1 - diversity) * relevance[remaining] - diversity * redundancy
+        best = remaining[int(np.argmax(scores))]
+        selected.append(best)
+        remaining.remove(best)
+    return [candidates[i] for i in selected]
+
+
+def extract_keyphrases(papers: list[ArxivPaper], encoder, top_k: int = 8, diversity: float = 0.5) -> list[list[str]]:
+    """
+    为所有论文抽取关键词，文档与候选短语一次性批量编码
+    :param encoder: SentenceTransformer 模型（与排序共用）
+    """
+    documents = []
+    candidates = []
+    for paper in papers:
+        # 只使用已经下载的 LaTeX 源码，不为了标签单独逐篇下载
+        introduction = paper.introduction_excerpt() if 'tex' in paper.__dict__ else ""
+        document = f"{paper.title}. {paper.summary} {introduction}"
+        documents.append(document)
+        candidates.append(candidate_phrases(document))
+
+    texts = documents + [c for paper_candidates in candidates for c in paper_candidates]
+    embeddings = encoder.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+
+    results = []
+    offset = len(documents)
+    for i, paper_candidates in enumerate(candidates):
+        candidate_embeddings = embeddings[offset:offset + len(paper_candidates)]
+        offset += len(paper_candidates)
+        results.append(mmr(embeddings[i], candidate_embeddings, paper_candidates, top_k, diversity))
+    return results
+
+
+def tag_papers(papers: list[ArxivPaper], encoder, top_k: int = 8, diversity: float = 0.5):
+    """
+    为论文写入 tags 字段缓存，替代逐篇调用 LLM
+    """
+    if not papers:
+        return
+    for paper, tags in zip(papers, extract_keyphrases(papers, encoder, top_k, diversity)):
+        paper.__dict__['tags'] = tags
+    logger.info(f"Tagged {len(papers)} papers with embedding keyphrases")
@@ -0,0 +1,95 @@
+"""
+LaTeX 正文压缩
+
+送入 LLM 之前去掉对理解内容没有帮助的 LaTeX 结构：公式折叠为占位符，去掉 \\label / \\ref / 脚注 /
+排版命令 / 图表等环境，保留格式命令中的文字，从而在相同 token 预算内放入更多真正的正文。
+作者自定义的无参数宏（通常是方法名，如 \\ours）予以保留。
+"""
+import re
+
+MATH_PLACEHOLDER = "[MATH]"
+EQUATION_PLACEHOLDER = "[EQUATION]"
+
+# 整体删除的环境
+DROP_ENVIRONMENTS = ['figure', 'table', 'algorithm', 'algorithmic', 'lstlisting', 'verbatim', 'minted',
+                     'tikzpicture', 'wrapfigure', 'wraptable', 'tabular', 'subfigure']
+# 折叠为公式占位符的环境
+MATH_ENVIRONMENTS = ['equation', 'align', 'gather', 'multline', 'eqnarray', 'displaymath', 'math', 'flalign']
+# 连同参数一起删除的命令
+DROP_COMMANDS = ['label', 'ref', 'eqref', 'autoref', 'cref', 'Cref', 'pageref', 'cite', 'citep', 'citet',
+                 'footnote', 'footnotetext', 'url', 'vspace', 'hspace', 'includegraphics', 'input', 'bibliographystyle',
+                 'bibliography', 'thispagestyle', 'pagestyle', 'setlength', 'addtolength', 'newcommand',
+                 'renewcommand', 'definecolor', 'todo']
+# 只保留参数文字的格式命令
+UNWRAP_COMMANDS = ['textbf', 'textit', 'emph', 'underline', 'texttt', 'textsc', 'textrm', 'textsf', 'mbox',
+                   'text', 'textnormal', 'mathrm', 'mathbf', 'uline', 'hl', 'textcolor']
+# 无参数的排版命令
+NOISE_COMMANDS = ['noindent', 'centering', 'hfill', 'vfill', 'newline', 'linebreak', 'pagebreak', 'newpage',
+                  'clearpage', 'smallskip', 'medskip', 'bigskip', 'par', 'maketitle', 'small', 'footnotesize',
+                  'normalsize', 'large', 'Large', 'protect', 'xspace']
+
+
+def _strip_command_with_argument(text: str, name: str, keep: bool) -> str:
+    """
+    处理 \\name[...]{...}（参数允许嵌套花括号）：keep 为 True 时保留参数内容，否则整体删除
+    """
+    pattern = re.compile(r'~?\\' + name + r'\*?(\s*\[[^\]]*\])*\s*\{')
+    result = []
+    pos = 0
+    for match in pattern.finditer(text):
+        if match.start() < pos:
+            continue
+        depth, i = 1, match.end()
+        while i < len(text) and depth:
+            if text[i] == '\\':
+                i += 2
+                continue
+            depth += {'{': 1, '}': -1}.get(text[i], 0)
+            i += 1
+        if depth:
+            break
+        result.append(text[pos:match.start()])
+        if keep:
+            argument = text[match.end():i - 1]
+            # \textcolor{red}{文字} 的第一个参数是颜色
+            if name == 'textcolor' and i < len(text) and text[i] == '{':
+                end = text.find('}', i)
+                argument, i = text[i + 1:end], end + 1
+            result.append(argument)
+        pos = i
+    result.append(text[pos:])
+    return ''.join(result)
+
+
+def compress_latex(text: str, max_inline_math: int = 20) -> str:
+    """
+    压缩 LaTeX 正文
+    :param max_inline_math: 行内公式不超过该长度时保留原文（如 $O(n)$），否则替换为占位符
+    """
+    if not text:
+        return text
+    text = re.sub(r'(?<!\\)%.*', '', text)
+    for env in DROP_ENVIRONMENTS:
+        text = re.sub(r'\\begin\{' + env + r'\*?\}.*?\\end\{' + env + r'\*?\}', '', text, flags=re.DOTALL)
+    for env in MATH_ENVIRONMENTS:
+        text = re.sub(r'\\begin\{' + env + r'\*?\}.*?\\end\{' + env + r'\*?\}', f' {EQUATION_PLACEHOLDER} ',
+                      text, flags=re.DOTALL)
+    text = re.sub(r'\$\$.*?\$\$|\\\[.*?\\\]', f' {EQUATION_PLACEHOLDER} ', text, flags=re.DOTALL)
+    text = re.sub(r'(?<!\\)\$(.+?)(?<!\\)\$',
+                  lambda m: m.group(0) if len(m.group(1)) <= max_inline_math else MATH_PLACEHOLDER,
+                  text, flags=re.DOTALL)
+    for name in DROP_COMMANDS:
+        text = _strip_command_with_argument(text, name, keep=False)
+    for name in UNWRAP_COMMANDS:
+        text = _strip_command_with_argument(text, name, keep=True)
+    # 章节标题保留文字
+    text = re.sub(r'\\(sub)*section\*?\{([^{}]*)\}', lambda m: f"\n{m.group(2)}\n", text)
+    text = re.sub(r'\\paragraph\*?\{([^{}]*)\}', r'\1:', text)
+    text = re.sub(r'\\begin\{(itemize|enumerate|description|center|quote|abstract)\}|\\end\{(itemize|enumerate|description|center|quote|abstract)\}', '', text)
+    text = re.sub(r'\\item\b(\[[^\]]*\])?', '\n- ', text)
+    text = re.sub(r'\\(' + '|'.join(NOISE_COMMANDS) + r')\b(\[[^\]]*\])?', ' ', text)
+    text = re.sub(r'\\\\(\[[^\]]*\])?', '\n', text)
+    text = text.replace('~', ' ').replace('\\%', '%').replace('\\&', '&')
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r' *\n[ \n]*', '\n', text)
+    return text.strip()
@@ -0,0 +1,287 @@
+"""
+本地 llama 多进程推理池
+
+每个 worker 进程绑定到一组独立的 CPU 核心，各自加载同一个 GGUF 模型（llama.cpp 默认 mmap 加载，
+权重通过页缓存在进程间共享，不会按 worker 数量成倍占用内存）。请求先在父进程中排队，
+由父进程逐条分配给空闲的 worker（每个 worker 一个队列，同一时间只处理一条），
+因此父进程始终知道每个 worker 正在处理哪条请求，已取消的请求也不会再发给 worker。
+"""
+import argparse
+import atexit
+import collections
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import perf_counter
+from loguru import logger
+
+GLOBAL_LLAMA_POOL = None
+
+
+def split_cores(cores: list[int], n_workers: int) -> list[list[int]]:
+    """将核心列表切分为 n_workers 个连续、互不重叠的子集"""
+    n_workers = max(1, min(n_workers, len(cores)))
+    size, extra = divmod(len(cores), n_workers)
+    groups = []
+    start = 0
+    for i in range(n_workers):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+
+def _worker_main(worker_id: int, cores: list[int], request_queue, result_queue, cache_size: int):
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    # 线程数与绑定的核心数一致
+    os.environ['LLAMA_N_THREADS'] = str(len(cores))
+    # 每个 worker 有独立的 RAM 缓存，总预算按 worker 数均分
+    os.environ['LLAMA_CACHE_SIZE'] = str(cache_size)
+    from llm import load_local_llama, compile_grammar
+    try:
+        llama = load_local_llama()
+    except Exception as e:
+        result_queue.put(('ready', worker_id, repr(e)))
+        return
+    result_queue.put(('ready', worker_id, None))
+
+    while True:
+        item = request_queue.get()
+        if item is None:
+            break
+        request_id, kwargs = item
+        try:
+            if isinstance(kwargs.get('grammar'), str):
+                kwargs['grammar'] = compile_grammar(kwargs['grammar'])
+            start = perf_counter()
+            response = llama.create_chat_completion(**kwargs)
+            response["worker_id"] = worker_id
+            response["elapsed"] = perf_counter() - start
+            result_queue.put(('done', worker_id, request_id, (response, None)))
+        except Exception as e:
+            result_queue.put(('done', worker_id, request_id, (None, repr(e))))
+
+
+class LlamaWorkerPool:
+    """
+    多个本地 llama 进程组成的推理池，接口与 Llama.create_chat_completion 保持一致（不支持 stream）
+    """
+
+    def __init__(self, n_workers: int = None, threads_per_worker: int = None):
+        """
+        :param n_workers: worker 进程数，默认按 threads_per_worker 切分可用核心
+        :param threads_per_worker: 每个 worker 的线程（核心）数，默认 4
+        """
+        from llm import available_cores
+        if hasattr(os, 'sched_getaffinity'):
+            cores = sorted(os.sched_getaffinity(0))
+        else:
+            cores = list(range(available_cores()))
+        threads_per_worker = threads_per_worker or int(os.getenv('LLAMA_THREADS_PER_WORKER', '4'))
+        n_workers = n_workers or max(1, len(cores) // threads_per_worker)
+        self.core_groups = split_cores(cores, n_workers)
+
+        # 父进程可能已经加载了 torch 等多线程库，使用 spawn 避免 fork 带来的死锁
+        ctx = mp.get_context('spawn')
+        self._request_queues = [ctx.Queue() for _ in self.core_groups]
+        self._result_queue = ctx.Queue()
+        self._futures: dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending = collections.deque()  # 等待分配的 (request_id, kwargs)
+        self._assigned: dict[int, int] = {}  # worker_id -> 正在处理的 request_id
+        self._idle: list[int] = []
+        self._dead: set[int] = set()
+        self._closing = False
+        self.request_timeout = float(os.getenv('LLAMA_REQUEST_TIMEOUT', '600'))
+        cache_size = int(os.getenv('LLAMA_CACHE_SIZE', str(2 << 30))) // len(self.core_groups)
+
+        start = perf_counter()
+        self._workers = [
+            ctx.Process(target=_worker_main, args=(i, group, self._request_queues[i], self._result_queue, cache_size),
+                        daemon=True)
+            for i, group in enumerate(self.core_groups)
+        ]
+        for w in self._workers:
+            w.start()
+        deadline = perf_counter() + float(os.getenv('LLAMA_STARTUP_TIMEOUT', '900'))
+        ready = 0
+        while ready < len(self._workers):
+            try:
+                _, worker_id, error = self._result_queue.get(timeout=5)
+            except queue.Empty:
+                # 加载模型时被 OOM kill 等情况不会发送消息，需要检查进程是否还在
+                dead = [i for i, w in enumerate(self._workers) if not w.is_alive()]
+                error = f"exited with code {self._workers[dead[0]].exitcode}" if dead else None
+                if dead or perf_counter() > deadline:
+                    self.close()
+                    raise RuntimeError(f"Local LLM worker {dead[0] if dead else '?'} failed to start: "
+                                       f"{error or 'timed out'}")
+                continue
+            if error is not None:
+                self.close()
+                raise RuntimeError(f"Local LLM worker {worker_id} failed to start: {error}")
+            ready += 1
+        self._idle = list(range(len(self._workers)))
+        logger.info(f"Started {len(self._workers)} local LLM workers in {perf_counter() - start:.1f}s "
+                    f"(cores per worker: {[len(g) for g in self.core_groups]})")
+
+        self._dispatcher = threading.Thread(target=self._collect_results, daemon=True)
+        self._dispatcher.start()
+
+    @property
+    def n_workers(self) -> int:
+        return len(self._workers)
+
+    def _collect_results(self):
+        last_check = perf_counter()
+        while True:
+            if perf_counter() - last_check >= 1:
+                self._check_workers()
+                last_check = perf_counter()
+            try:
+                item = self._result_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            _, worker_id, request_id, (response, error) = item
+            with self._lock:
+                self._assigned.pop(worker_id, None)
+                if worker_id not in self._dead:
+                    self._idle.append(worker_id)
+                future = self._futures.pop(request_id, None)
+                self._dispatch()
+            if future is None or future.done():
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(response)
+
+    def _dispatch(self):
+        """把排队的请求分配给空闲的 worker，跳过已取消的请求；调用方需持有 self._lock"""
+        while self._idle and self._pending:
+            request_id, kwargs = self._pending.popleft()
+            if request_id not in self._futures:
+                continue
+            worker_id = self._idle.pop()
+            self._assigned[worker_id] = request_id
+            self._request_queues[worker_id].put((request_id, kwargs))
+
+    def _check_workers(self):
+        """worker 异常退出（OOM、段错误）时，让分配给它的请求失败；全部退出时让所有等待中的请求失败"""
+        if self._closing:
+            return
+        newly_dead = [i for i, w in enumerate(self._workers) if i not in self._dead and not w.is_alive()]
+        if not newly_dead:
+            return
+        self._dead.update(newly_dead)
+        for i in newly_dead:
+            logger.error(f"Local LLM worker {i} exited unexpectedly with code {self._workers[i].exitcode}")
+        all_dead = len(self._dead) == len(self._workers)
+        with self._lock:
+            self._idle = [i for i in self._idle if i not in self._dead]
+            failed = [self._assigned.pop(i) for i in newly_dead if i in self._assigned]
+            if all_dead:
+                failed = list(self._futures)
+                self._pending.clear()
+            futures = [self._futures.pop(request_id) for request_id in failed if request_id in self._futures]
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError("Local LLM worker exited before finishing the request"))
+
+    def submit(self, **kwargs) -> Future:
+        """提交一条 chat completion 请求，返回 Future"""
+        kwargs.pop('stream', None)
+        request_id = next(self._ids)
+        future = Future()
+        if len(self._dead) == len(self._workers):
+            future.set_exception(RuntimeError("All local LLM workers have exited"))
+            return future
+        with self._lock:
+            self._futures[request_id] = future
+            self._pending.append((request_id, kwargs))
+            self._dispatch()
+        return future
+
+    def cancel(self, future: Future):
+        """取消请求：还在排队的请求不会再分配给 worker，正在处理的请求结果会被丢弃"""
+        with self._lock:
+            for request_id, f in list(self._futures.items()):
+                if f is future:
+                    del self._futures[request_id]
+        future.cancel()
+
+    def create_chat_completion(self, **kwargs) -> dict:
+        future = self.submit(**kwargs)
+        try:
+            response = future.result(timeout=self.request_timeout)
+        except TimeoutError:
+            self.cancel(future)
+            raise TimeoutError(f"Local LLM request timed out after {self.request_timeout:.0f}s")
+        logger.debug(f"Local LLM worker {response['worker_id']} finished in {response['elapsed']:.2f}s")
+        return response
+
+    def close(self):
+        self._closing = True
+        for request_queue in self._request_queues:
+            request_queue.put(None)
+        for w in self._workers:
+            w.join(timeout=10)
+            if w.is_alive():
+                w.terminate()
+        self._result_queue.put(None)
+
+
+def get_llama_pool(n_workers: int = None) -> LlamaWorkerPool:
+    global GLOBAL_LLAMA_POOL
+    if GLOBAL_LLAMA_POOL is None:
+        GLOBAL_LLAMA_POOL = LlamaWorkerPool(n_workers)
+        atexit.register(GLOBAL_LLAMA_POOL.close)
+    return GLOBAL_LLAMA_POOL
+
+
+def benchmark(worker_counts: list[int], n_requests: int):
+    """对不同 worker 数量测量吞吐量（请求/分钟），结果按核心数输出"""
+    from llm import available_cores
+    messages = [
+        {"role": "system", "content": "You are an assistant who perfectly summarizes scientific paper, and gives the core idea of the paper to the user."},
+        {"role": "user", "content": "Generate a one-sentence TLDR summary in English:\n\\title{Attention Is All You Need}\n"
+                                    "\\begin{abstract}The dominant sequence transduction models are based on complex recurrent or "
+                                    "convolutional neural networks. We propose a new simple network architecture, the Transformer, "
+                                    "based solely on attention mechanisms.\\end{abstract}"},
+    ]
+    cores = available_cores()
+    results = []
+    for n_workers in worker_counts:
+        pool = LlamaWorkerPool(n_workers)
+        try:
+            start = perf_counter()
+            with ThreadPoolExecutor(max_workers=pool.n_workers * 2) as executor:
+                list(executor.map(lambda _: pool.create_chat_completion(messages=messages, temperature=0, max_tokens=64),
+                                  range(n_requests)))
+            elapsed = perf_counter() - start
+        finally:
+            pool.close()
+        throughput = n_requests / elapsed * 60
+        results.append((pool.n_workers, throughput))
+        logger.info(f"workers={pool.n_workers}, cores={cores}: {n_requests} requests in {elapsed:.1f}s "
+                    f"({throughput:.1f} req/min, {throughput / cores:.2f} req/min/core)")
+
+    print(f"{'workers':>8} {'cores/worker':>13} {'req/min':>10} {'speedup':>8}")
+    base = results[0][1]
+    for n_workers, throughput in results:
+        print(f"{n_workers:>8} {cores // n_workers:>13} {throughput:>10.1f} {throughput / base:>7.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark local LLM worker pool throughput')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts to benchmark')
+    parser.add_argument('--requests', type=int, default=32, help='Number of requests per run')
+    args = parser.parse_args()
+    benchmark(args.workers, args.requests)
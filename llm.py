@@ -1,112 +1,370 @@
-from llama_cpp import Llama
-from openai import OpenAI
+from llama_cpp import Llama, LlamaRAMCache, LlamaDiskCache, LlamaGrammar
+from openai import OpenAI, RateLimitError
 from loguru import logger
-from time import sleep
+from time import perf_counter
 import base64
+import os
+import threading
+from functools import lru_cache
+from rate_limiter import get_controller, wait_time_from_headers, CircuitOpenError, report_controllers
+from hedging import get_hedge_policy, hedging_enabled, report_hedging, HedgeCancelled, cancelled, wait_or_cancelled
 
 GLOBAL_LLM = None
 GLOBAL_VISION_LLM = None
+# 按任务（如 tags、affiliations）指定的 LLM，未指定的任务使用 GLOBAL_LLM
+TASK_LLMS = {}
+TASK_STATS = {}
+_task_stats_lock = threading.Lock()
+# 本地模型在进程内只加载一次，所有 LLM 实例共享
+LOCAL_LLAMA = None
+
+
+def available_cores() -> int:
+    """当前进程可用的 CPU 核数（考虑 cgroup/affinity 限制）"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 4
+
+
+def load_local_llama() -> Llama:
+    """
+    加载本地 Qwen2.5-3B 模型并开启 prompt 缓存
+    线程数与 batch 大小按可用核数自动设置，可通过 LLAMA_N_THREADS / LLAMA_N_BATCH 覆盖；
+    LLAMA_CACHE=ram|disk|none 选择 KV 缓存类型（默认 ram），使 TLDR/标签/单位等共享系统提示词的前缀只计算一次
+    """
+    global LOCAL_LLAMA
+    if LOCAL_LLAMA is not None:
+        return LOCAL_LLAMA
+
+    n_threads = int(os.getenv('LLAMA_N_THREADS', '0')) or available_cores()
+    n_batch = int(os.getenv('LLAMA_N_BATCH', '0')) or min(512, 64 * n_threads)
+    start = perf_counter()
+    LOCAL_LLAMA = Llama.from_pretrained(
+        repo_id="Qwen/Qwen2.5-3B-Instruct-GGUF",
+        filename="qwen2.5-3b-instruct-q4_k_m.gguf",
+        n_ctx=5_000,
+        n_threads=n_threads,
+        n_threads_batch=n_threads,
+        n_batch=n_batch,
+        verbose=False,
+    )
+    logger.info(f"Loaded local LLM in {perf_counter() - start:.1f}s (n_threads={n_threads}, n_batch={n_batch})")
+
+    cache_type = os.getenv('LLAMA_CACHE', 'ram').lower()
+    cache_size = int(os.getenv('LLAMA_CACHE_SIZE', str(2 << 30)))
+    if cache_type == 'ram':
+        LOCAL_LLAMA.set_cache(LlamaRAMCache(capacity_bytes=cache_size))
+    elif cache_type == 'disk':
+        cache_dir = os.getenv('LLAMA_CACHE_DIR', '.cache/llama_cache')
+        LOCAL_LLAMA.set_cache(LlamaDiskCache(cache_dir=cache_dir, capacity_bytes=cache_size))
+    logger.debug(f"Local LLM prompt cache: {cache_type}")
+    return LOCAL_LLAMA
+
+
+def string_list_grammar(max_items: int = None) -> str:
+    """
+    生成只允许输出 JSON 字符串列表的 GBNF 语法，可限制最大元素个数
+    """
+    repeat = f"{{0,{max_items - 1}}}" if max_items else "*"
+    return (
+        f'root ::= "[" ws ( string ( ws "," ws string ){repeat} )? ws "]"\n'
+        'string ::= "\\"" ( [^"\\\\\\x7F\\x00-\\x1F] | "\\\\" ["\\\\/bfnrt] )* "\\""\n'
+        'ws ::= [ \\t\\n]*\n'
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_grammar(grammar: str) -> LlamaGrammar:
+    """编译 GBNF 语法（按文本缓存，每个进程只编译一次）"""
+    return LlamaGrammar.from_string(grammar, verbose=False)
+
+
+class ListStreamScanner:
+    """
+    增量扫描流式输出，检测到第一个完整配平的 [...] 列表（忽略字符串中的括号和 <think> 推理内容）时结束
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+        self.list_text = None
+
+    def feed(self, delta: str) -> bool:
+        """追加一段输出，返回是否已得到完整列表"""
+        self.buffer += delta
+        if self.list_text is not None:
+            return True
+        if "<think>" in self.buffer:
+            end = self.buffer.rfind("</think>")
+            if end < 0:
+                return False
+            self._pos = max(self._pos, end + len("</think>"))
+        while self._pos < len(self.buffer):
+            ch = self.buffer[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if ch == "[":
+                    self._start = self._pos - 1
+                    self._depth = 1
+                continue
+            if self._quote:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._quote:
+                    self._quote = None
+            elif ch in "'\"":
+                self._quote = ch
+            elif ch == "[":
+                self._depth += 1
+            elif ch == "]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.list_text = self.buffer[self._start:self._pos]
+                    return True
+        return False
+
+    def result(self) -> str:
+        return self.list_text if self.list_text is not None else self.buffer
+
 
 class LLM:
-    def __init__(self, api_key: str = None, base_url: str = None, model: str = None,lang: str = "English"):
+    def __init__(self, api_key: str = None, base_url: str = None, model: str = None,lang: str = "English", max_retries: int = None, hedge: bool = None):
         if api_key:
-            self.llm = OpenAI(api_key=api_key, base_url=base_url, timeout=120.0)  # 添加120秒超时
+            # 重试由 _chat_completion 统一处理，关闭 SDK 内置重试避免叠加
+            self.llm = OpenAI(api_key=api_key, base_url=base_url, timeout=120.0, max_retries=0)  # 添加120秒超时
         else:
-            self.llm = Llama.from_pretrained(
-                repo_id="Qwen/Qwen2.5-3B-Instruct-GGUF",
-                filename="qwen2.5-3b-instruct-q4_k_m.gguf",
-                n_ctx=5_000,
-                n_threads=4,
-                verbose=False,
-            )
+            n_workers = int(os.getenv('LOCAL_LLM_WORKERS', '1'))
+            if n_workers != 1:
+                # 多进程推理池（0 表示按可用核心自动决定 worker 数）
+                from llama_pool import get_llama_pool
+                self.llm = get_llama_pool(n_workers or None)
+            else:
+                self.llm = load_local_llama()
         self.model = model
         self.lang = lang
+        self.max_retries = max_retries or int(os.getenv('LLM_MAX_RETRIES', '3'))
+        # 对冲请求仅对 API 模式生效（LLM_HEDGE=true 开启）
+        self.hedge = hedging_enabled() if hedge is None else hedge
+
+    def _chat_completion(self, label: str = "Attempt", on_stream=None, **kwargs):
+        """
+        带自适应并发控制的 chat completion 调用：
+        429 时按 Retry-After / x-ratelimit-* 头等待并降低并发，其他错误按指数退避重试；
+        重试耗尽计入熔断器，熔断期间直接抛出 CircuitOpenError
+        :param on_stream: 流式请求（stream=True）时用于消费输出流的函数，其返回值作为结果
+        """
+        controller = get_controller(str(self.llm.base_url))
+        max_retries = self.max_retries
+        for attempt in range(max_retries):
+            # 对冲中落败的请求不再重试
+            if cancelled():
+                raise HedgeCancelled(f"{label} cancelled after losing a hedged race")
+            try:
+                with controller.slot():
+                    start = perf_counter()
+                    raw = self.llm.chat.completions.with_raw_response.create(**kwargs)
+                    response = raw.parse()
+                    if on_stream is not None:
+                        response = on_stream(response)
+                    latency = perf_counter() - start
+                if cancelled():
+                    # 结果已被丢弃，不计入延迟统计
+                    raise HedgeCancelled(f"{label} finished after losing a hedged race")
+                controller.on_success(latency, raw.headers)
+                logger.debug(f"{label} {attempt + 1} succeeded in {latency:.1f}s")
+                return response
+            except (CircuitOpenError, HedgeCancelled):
+                raise
+            except RateLimitError as e:
+                logger.error(f"{label} {attempt + 1} failed: {type(e).__name__}: {e}")
+                if attempt == max_retries - 1:
+                    controller.on_failure()
+                    raise
+                # 控制器会暂停所有请求直到限流解除，下一次 slot() 自动等待
+                controller.on_rate_limited(e.response.headers)
+            except Exception as e:
+                if cancelled():
+                    raise HedgeCancelled(f"{label} cancelled after losing a hedged race") from e
+                logger.error(f"{label} {attempt + 1} failed: {type(e).__name__}: {e}")
+                if attempt == max_retries - 1:
+                    logger.error(f"All {max_retries} attempts failed, giving up")
+                    controller.on_failure()
+                    raise
+                response = getattr(e, 'response', None)
+                wait_time = wait_time_from_headers(getattr(response, 'headers', None)) or 5 * (2 ** attempt)
+                logger.info(f"Waiting {wait_time} seconds before retry...")
+                if wait_or_cancelled(wait_time):
+                    raise HedgeCancelled(f"{label} cancelled after losing a hedged race") from e
 
     def generate(self, messages: list[dict]) -> str:
         if isinstance(self.llm, OpenAI):
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = self.llm.chat.completions.create(messages=messages, temperature=0, model=self.model)
-                    break
-                except Exception as e:
-                    logger.error(f"Attempt {attempt + 1} failed: {e}")
-                    if attempt == max_retries - 1:
-                        raise
-                    # 使用指数退避策略，特别是对于 429 错误
-                    # 第1次重试等待 5 秒，第2次等待 10 秒
-                    wait_time = 5 * (2 ** attempt)
-                    logger.info(f"Waiting {wait_time} seconds before retry...")
-                    sleep(wait_time)
+            call = lambda: self._chat_completion(messages=messages, temperature=0, model=self.model)
+            response = get_hedge_policy('text').run(call) if self.hedge else call()
             return response.choices[0].message.content
+        elif not isinstance(self.llm, Llama):
+            # 本地多进程推理池
+            response = self.llm.create_chat_completion(messages=messages, temperature=0)
+            return response["choices"][0]["message"]["content"]
         else:
-            response = self.llm.create_chat_completion(messages=messages,temperature=0)
+            return self._generate_local(messages)
+
+    def generate_list(self, messages: list[dict], max_tokens: int = 256, max_items: int = None) -> str:
+        """
+        流式生成列表型输出（如标签、单位）：一旦解析到完整配平的 [...] 立即停止生成，
+        并以 max_tokens 作为硬上限，减少推理模型在列表之后继续输出带来的延迟和 token 消耗。
+        本地模型使用 GBNF 语法约束解码，只能输出 JSON 字符串列表（最多 max_items 个元素）
+        :return: 完整的列表文本；未得到完整列表时返回已生成的全部内容
+        """
+        if isinstance(self.llm, OpenAI):
+            def consume(stream):
+                scanner = ListStreamScanner()
+                n_chunks = 0
+                try:
+                    for chunk in stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            n_chunks += 1
+                            if scanner.feed(chunk.choices[0].delta.content):
+                                logger.debug(f"List output complete after {n_chunks} chunks, stopping stream")
+                                break
+                finally:
+                    # 关闭连接，服务端随之停止生成
+                    stream.close()
+                return scanner.result()
+            return self._chat_completion(on_stream=consume, messages=messages, temperature=0, model=self.model,
+                                         max_tokens=max_tokens, stream=True)
+        elif not isinstance(self.llm, Llama):
+            # 多进程推理池不支持流式输出，语法以文本形式传给 worker 编译
+            response = self.llm.create_chat_completion(messages=messages, temperature=0, max_tokens=max_tokens,
+                                                       grammar=string_list_grammar(max_items))
             return response["choices"][0]["message"]["content"]
+        else:
+            scanner = ListStreamScanner()
+            self._generate_local(messages, max_tokens=max_tokens, stop=scanner.feed,
+                                 grammar=compile_grammar(string_list_grammar(max_items)))
+            return scanner.result()
+
+    def _generate_local(self, messages: list[dict], max_tokens: int = None, stop=None, grammar: LlamaGrammar = None) -> str:
+        """
+        本地模型以流式方式生成，以便区分 prompt 评估（首个 token 之前）与生成阶段的耗时
+        :param stop: 可选的回调，接收每段新输出，返回 True 时提前结束生成
+        :param grammar: 可选的 GBNF 语法，约束输出结构
+        """
+        start = perf_counter()
+        first_token_at = None
+        n_chunks = 0
+        content = []
+        stream = self.llm.create_chat_completion(messages=messages, temperature=0, max_tokens=max_tokens,
+                                                 grammar=grammar, stream=True)
+        for chunk in stream:
+            delta = chunk["choices"][0]["delta"].get("content")
+            if delta:
+                if first_token_at is None:
+                    first_token_at = perf_counter()
+                n_chunks += 1
+                content.append(delta)
+                if stop is not None and stop(delta):
+                    stream.close()
+                    break
+        end = perf_counter()
+        first_token_at = first_token_at or end
+        logger.debug(f"Local LLM: prompt eval {first_token_at - start:.2f}s, "
+                     f"generation {end - first_token_at:.2f}s ({n_chunks} tokens)")
+        return "".join(content)
+
+    @property
+    def models(self) -> list[str]:
+        """可能给出回答的模型，用于按模型查找缓存"""
+        return [self.model]
 
-    def generate_with_vision(self, text_prompt: str, image_base64: str) -> str:
+    def generate_with_vision(self, text_prompt: str, image_base64: str, mime_type: str = "image/png",
+                             with_model: bool = False):
         """
         使用vision模型分析图片并生成文本描述
         :param text_prompt: 文本提示
         :param image_base64: base64编码的图片数据
+        :param mime_type: 图片的 MIME 类型
+        :param with_model: 为 True 时返回 (描述, 给出回答的模型)
         :return: LLM生成的描述
         """
         if not isinstance(self.llm, OpenAI):
             logger.warning("Vision mode is only supported with OpenAI API. Returning empty string.")
-            return ""
+            return ("", self.model) if with_model else ""
 
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                logger.debug(f"Vision API attempt {attempt + 1}/{max_retries} - Calling with timeout=120s, image size={len(image_base64)} chars")
-                response = self.llm.chat.completions.create(
-                    model=self.model,
-                    messages=[
+        logger.debug(f"Calling vision API with timeout=120s, image size={len(image_base64)} chars")
+        call = lambda: self._chat_completion(
+            label="Vision API attempt",
+            model=self.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
                         {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": text_prompt
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/png;base64,{image_base64}"
-                                    }
-                                }
-                            ]
+                            "type": "text",
+                            "text": text_prompt
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{image_base64}"
+                            }
                         }
-                    ],
-                    temperature=0,
-                    timeout=120.0  # 显式设置超时
-                )
-                logger.debug(f"Vision API attempt {attempt + 1} succeeded")
-                return response.choices[0].message.content
-            except Exception as e:
-                logger.error(f"Vision API attempt {attempt + 1} failed: {type(e).__name__}: {e}")
-                if attempt == max_retries - 1:
-                    logger.error(f"All {max_retries} attempts failed, giving up")
-                    raise
-                wait_time = 5 * (2 ** attempt)
-                logger.info(f"Waiting {wait_time} seconds before retry...")
-                sleep(wait_time)
+                    ]
+                }
+            ],
+            temperature=0,
+            timeout=120.0  # 显式设置超时
+        )
+        response = get_hedge_policy('vision').run(call) if self.hedge else call()
+        content = response.choices[0].message.content
+        return (content, self.model) if with_model else content
 
-def set_global_llm(api_key: str = None, base_url: str = None, model: str = None, lang: str = "English"):
+def set_global_llm(api_key: str = None, base_url: str = None, model: str = None, lang: str = "English", endpoints: list[dict] = None):
+    """
+    设置全局 LLM；提供 endpoints（多个 base_url/api_key/model/weight 配置）时使用多接口路由
+    """
     global GLOBAL_LLM
-    GLOBAL_LLM = LLM(api_key=api_key, base_url=base_url, model=model, lang=lang)
+    if endpoints:
+        from llm_router import LLMRouter
+        GLOBAL_LLM = LLMRouter.from_config(endpoints, lang=lang)
+    else:
+        GLOBAL_LLM = LLM(api_key=api_key, base_url=base_url, model=model, lang=lang)
 
-def set_global_vision_llm(api_key: str, base_url: str, model: str, lang: str = "English"):
+def set_global_vision_llm(api_key: str = None, base_url: str = None, model: str = None, lang: str = "English", endpoints: list[dict] = None):
     """
     设置全局vision LLM（需要使用支持vision的模型）
     """
     global GLOBAL_VISION_LLM
-    GLOBAL_VISION_LLM = LLM(api_key=api_key, base_url=base_url, model=model, lang=lang)
+    if endpoints:
+        from llm_router import LLMRouter
+        GLOBAL_VISION_LLM = LLMRouter.from_config(endpoints, lang=lang)
+    else:
+        GLOBAL_VISION_LLM = LLM(api_key=api_key, base_url=base_url, model=model, lang=lang)
+
+def set_task_llm(task: str, llm: LLM):
+    """
+    为特定任务指定 LLM（例如把标签、单位等简单抽取任务交给小模型或本地模型）
+    """
+    TASK_LLMS[task] = llm
 
-def get_llm() -> LLM:
+def get_llm(task: str = None) -> LLM:
+    """
+    获取 LLM；指定 task 时返回该任务专用的 LLM（未指定则回退到全局 LLM），并统计该任务的耗时与 token 数
+    """
+    if task in TASK_LLMS:
+        return TaskLLM(task, TASK_LLMS[task])
     if GLOBAL_LLM is None:
         logger.info("No global LLM found, creating a default one. Use `set_global_llm` to set a custom one.")
         set_global_llm()
-    return GLOBAL_LLM
+    if task is None:
+        return GLOBAL_LLM
+    return TaskLLM(task, GLOBAL_LLM)
 
 def get_vision_llm() -> LLM:
     """
@@ -114,5 +372,81 @@ def get_vision_llm() -> LLM:
     """
     if GLOBAL_VISION_LLM is None:
         logger.info("No global vision LLM found, using regular LLM.")
-        return get_llm()
-    return GLOBAL_VISION_LLM
\ No newline at end of file
+        return TaskLLM('vision', get_llm())
+    return TaskLLM('vision', GLOBAL_VISION_LLM)
+
+class TaskLLM:
+    """
+    为特定任务包装 LLM，记录该任务的调用次数、失败次数、耗时以及 prompt / 输出 token 数
+    （按字符数估计，不对完整 prompt 做 tokenizer 编码）
+    """
+
+    def __init__(self, task: str, llm: LLM):
+        self.task = task
+        self.llm = llm
+
+    @property
+    def lang(self) -> str:
+        return self.llm.lang
+
+    @property
+    def model(self) -> str:
+        return self.llm.model
+
+    @property
+    def models(self) -> list[str]:
+        return self.llm.models
+
+    @property
+    def is_local(self) -> bool:
+        return isinstance(self.llm, LLM) and not isinstance(self.llm.llm, OpenAI)
+
+    def _record(self, prompt: str, output: str, elapsed: float, failed: bool = False):
+        from prompt_builder import CHARS_PER_TOKEN
+        with _task_stats_lock:
+            stats = TASK_STATS.setdefault(self.task, {'model': self.model or 'local', 'calls': 0, 'failures': 0,
+                                                      'seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0})
+            stats['calls'] += 1
+            stats['failures'] += failed
+            stats['seconds'] += elapsed
+            stats['prompt_tokens'] += len(prompt) // CHARS_PER_TOKEN
+            stats['completion_tokens'] += len(output or "") // CHARS_PER_TOKEN
+
+    def _timed(self, prompt: str, fn, *args, **kwargs):
+        start = perf_counter()
+        try:
+            output = fn(*args, **kwargs)
+        except Exception:
+            # 失败的调用同样计入次数和耗时
+            self._record(prompt, None, perf_counter() - start, failed=True)
+            raise
+        self._record(prompt, output[0] if isinstance(output, tuple) else output, perf_counter() - start)
+        return output
+
+    def generate(self, messages: list[dict]) -> str:
+        prompt = "\n".join(m["content"] for m in messages)
+        return self._timed(prompt, self.llm.generate, messages)
+
+    def generate_list(self, messages: list[dict], max_tokens: int = 256, max_items: int = None) -> str:
+        prompt = "\n".join(m["content"] for m in messages)
+        return self._timed(prompt, self.llm.generate_list, messages, max_tokens=max_tokens, max_items=max_items)
+
+    def generate_with_vision(self, text_prompt: str, image_base64: str, mime_type: str = "image/png",
+                             with_model: bool = False):
+        return self._timed(text_prompt, self.llm.generate_with_vision, text_prompt, image_base64, mime_type,
+                           with_model=with_model)
+
+def report_llm_usage():
+    """
+    输出本次运行的 LLM 调用统计（各接口的请求数、失败数与延迟）
+    """
+    for task, stats in TASK_STATS.items():
+        logger.info(f"LLM task {task} ({stats['model']}): {stats['calls']} calls ({stats['failures']} failed), "
+                    f"{stats['seconds']:.1f}s total ({stats['seconds'] / stats['calls']:.1f}s avg), "
+                    f"~{stats['prompt_tokens']} prompt tokens, ~{stats['completion_tokens']} completion tokens")
+    llms = (GLOBAL_LLM, GLOBAL_VISION_LLM, *TASK_LLMS.values())
+    for llm in {id(l): l for l in llms if l is not None}.values():
+        if hasattr(llm, 'report'):
+            logger.info(f"LLM router: {llm.report()}")
+    report_controllers()
+    report_hedging()
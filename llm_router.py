@@ -0,0 +1,160 @@
+"""
+多接口 LLM 路由
+
+在多个 OpenAI 兼容接口（如 ModelScope、自建 vLLM、商业 API）之间按权重分配请求，
+跟踪每个接口的健康状态和延迟，出错时自动切换到其他接口，从而突破单一服务商的限流。
+对外接口与 LLM 保持一致（generate / generate_list / generate_with_vision / lang / model）。
+"""
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from loguru import logger
+from llm import LLM
+from hedging import get_hedge_policy, hedging_enabled, HedgeCancelled
+
+
+@dataclass
+class Endpoint:
+    name: str
+    llm: LLM
+    weight: float = 1.0
+    latency: float = None  # 延迟的指数滑动平均（秒）
+    consecutive_failures: int = 0
+    down_until: float = 0.0
+    stats: dict = field(default_factory=lambda: {'requests': 0, 'failures': 0})
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    @property
+    def score(self) -> float:
+        """选择权重：配置权重除以平滑延迟，延迟越低分到的请求越多"""
+        return self.weight / max(self.latency or 1.0, 0.1)
+
+
+class LLMRouter:
+    """
+    按权重和延迟在多个接口之间分配请求，失败时切换接口
+    """
+
+    def __init__(self, endpoints: list[Endpoint], lang: str = "English", cooldown: float = 30.0):
+        """
+        :param endpoints: 接口列表
+        :param lang: 输出语言
+        :param cooldown: 接口失败后暂停使用的基础时间（秒），连续失败时指数增长
+        """
+        if not endpoints:
+            raise ValueError("LLMRouter requires at least one endpoint")
+        self.endpoints = endpoints
+        self.lang = lang
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: list[dict], lang: str = "English") -> "LLMRouter":
+        """
+        从配置创建路由，每项包含 base_url、api_key、model，可选 weight、name
+        """
+        endpoints = [
+            Endpoint(
+                name=c.get('name') or f"{c['base_url']}#{c['model']}",
+                # 多个接口时单个接口少重试，失败后尽快切换到其他接口；只有一个接口时没有可切换的接口，
+                # 与单独使用 LLM 一样按 LLM_MAX_RETRIES 重试
+                # 对冲在路由层进行，副本请求发往其他接口
+                llm=LLM(api_key=c['api_key'], base_url=c['base_url'], model=c['model'], lang=lang,
+                        max_retries=int(c.get('max_retries', 1 if len(config) > 1 else os.getenv('LLM_MAX_RETRIES', '3'))),
+                        hedge=False),
+                weight=float(c.get('weight', 1.0)),
+            )
+            for c in config
+        ]
+        logger.info(f"LLM router with {len(endpoints)} endpoints: {', '.join(e.name for e in endpoints)}")
+        return cls(endpoints, lang)
+
+    @property
+    def model(self) -> str:
+        return self.endpoints[0].llm.model
+
+    @property
+    def models(self) -> list[str]:
+        return list(dict.fromkeys(e.llm.model for e in self.endpoints))
+
+    def _candidates(self) -> list[Endpoint]:
+        """
+        按加权随机顺序排列健康的接口，不健康的接口放在最后作为兜底
+        """
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.healthy]
+            unhealthy = sorted((e for e in self.endpoints if not e.healthy), key=lambda e: e.down_until)
+            ordered = []
+            while healthy:
+                chosen = random.choices(healthy, weights=[e.score for e in healthy])[0]
+                healthy.remove(chosen)
+                ordered.append(chosen)
+        return ordered + unhealthy
+
+    def _record(self, endpoint: Endpoint, latency: float = None, failed: bool = False):
+        with self._lock:
+            endpoint.stats['requests'] += 1
+            if failed:
+                endpoint.stats['failures'] += 1
+                endpoint.consecutive_failures += 1
+                backoff = self.cooldown * 2 ** min(endpoint.consecutive_failures - 1, 5)
+                endpoint.down_until = time.monotonic() + backoff
+                logger.warning(f"LLM endpoint {endpoint.name} marked unhealthy for {backoff:.0f}s")
+            else:
+                endpoint.consecutive_failures = 0
+                endpoint.down_until = 0.0
+                endpoint.latency = latency if endpoint.latency is None else 0.8 * endpoint.latency + 0.2 * latency
+
+    def _call_in_order(self, endpoints: list[Endpoint], method: str, *args, **kwargs):
+        last_error = None
+        for endpoint in endpoints:
+            start = time.monotonic()
+            try:
+                result = getattr(endpoint.llm, method)(*args, **kwargs)
+            except HedgeCancelled:
+                # 对冲落败不代表接口不健康，也不再尝试下一个接口
+                raise
+            except Exception as e:
+                logger.error(f"LLM endpoint {endpoint.name} failed: {type(e).__name__}: {e}")
+                self._record(endpoint, failed=True)
+                last_error = e
+                continue
+            self._record(endpoint, latency=time.monotonic() - start)
+            return result
+        raise last_error
+
+    def _call(self, method: str, *args, hedge_policy: str = None, **kwargs):
+        """
+        依次尝试候选接口；开启对冲时，副本请求从下一个接口开始尝试
+        """
+        endpoints = self._candidates()
+        primary = lambda: self._call_in_order(endpoints, method, *args, **kwargs)
+        if hedge_policy is None or not hedging_enabled():
+            return primary()
+        rotated = endpoints[1:] + endpoints[:1]
+        alternate = lambda: self._call_in_order(rotated, method, *args, **kwargs)
+        return get_hedge_policy(hedge_policy).run(primary, alternate)
+
+    def generate(self, messages: list[dict]) -> str:
+        return self._call('generate', messages, hedge_policy='text')
+
+    def generate_list(self, messages: list[dict], max_tokens: int = 256, max_items: int = None) -> str:
+        return self._call('generate_list', messages, max_tokens=max_tokens, max_items=max_items)
+
+    def generate_with_vision(self, text_prompt: str, image_base64: str, mime_type: str = "image/png",
+                             with_model: bool = False):
+        # 各接口的 LLM 返回自己的模型名，with_model 时调用方可以按实际回答的模型写缓存
+        return self._call('generate_with_vision', text_prompt, image_base64, mime_type, with_model=with_model,
+                          hedge_policy='vision')
+
+    def report(self) -> str:
+        return "; ".join(
+            f"{e.name}: {e.stats['requests']} requests, {e.stats['failures']} failed, "
+            f"avg latency {e.latency or 0:.1f}s"
+            for e in self.endpoints
+        )
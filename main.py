@@ -18,21 +18,28 @@ def _get_pdf_url_patch(links) -> str:
 arxiv.Result._get_pdf_url = _get_pdf_url_patch
 
 import argparse
+import json
 import os
 import sys
 from dotenv import load_dotenv
 load_dotenv(override=True)
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 from pyzotero import zotero
-from recommender import rerank_paper
-from construct_email import render_email, send_email
+from recommender import rerank_paper, get_embedding_model
+from keyphrase import tag_papers
+from construct_email import render_email, send_email, plan_email
 from tqdm import trange,tqdm
 from loguru import logger
 from gitignore_parser import parse_gitignore
 from tempfile import mkstemp
 from paper import ArxivPaper
-from llm import set_global_llm, set_global_vision_llm
+from llm import LLM, set_global_llm, set_global_vision_llm, set_task_llm, report_llm_usage
+from batch_enrich import enrich_papers_with_batch
+from affiliation_parser import report_affiliation_stats
+from disk_cache import report_caches
+from openai import OpenAI
 import feedparser
+from concurrent.futures import ThreadPoolExecutor
 
 def get_zotero_corpus(id:str,key:str) -> list[dict]:
     zot = zotero.Zotero(id, 'user', key)
@@ -92,6 +99,64 @@ def get_arxiv_paper(query:str, debug:bool=False) -> list[ArxivPaper]:
     return papers
 
 
+def get_enrichment_fields(papers:list[ArxivPaper]) -> list[list[str]]:
+    """
+    每篇论文需要 LLM 生成的字段，字段开关和邮件预算分配与 render_email 保持一致
+    """
+    plan = plan_email(len(papers))
+    # embedding 后端的标签不需要 LLM
+    enable_tags = os.getenv('ENABLE_TAGS', 'true').lower() == 'true' and os.getenv('TAGS_BACKEND', 'llm').lower() == 'llm'
+    fields = []
+    for idx in range(len(papers)):
+        if not plan[idx]['summary']:
+            # 超出邮件预算的论文只显示紧凑行，不需要任何增强字段
+            fields.append([])
+            continue
+        paper_fields = ['tldr']
+        if enable_tags:
+            paper_fields.append('tags')
+        if plan[idx]['details']:
+            paper_fields.append('affiliations')
+        fields.append(paper_fields)
+    return fields
+
+
+def enrich_papers(papers:list[ArxivPaper], fields:list[list[str]], max_workers:int):
+    """
+    并发预取论文的 LLM 增强字段。
+    同一篇论文的字段在同一线程内依次计算（共享 LaTeX 源码），不同论文之间并行。
+    """
+    def enrich(paper_fields):
+        p, paper_fields = paper_fields
+        for field in paper_fields:
+            try:
+                getattr(p, field)
+            except Exception as e:
+                logger.error(f"Failed to prefetch {field} of {p.arxiv_id}: {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(tqdm(executor.map(enrich, zip(papers, fields)), total=len(papers), desc='Enriching papers'))
+
+
+def prefetch_key_images(papers:list[ArxivPaper]):
+    """
+    MinerU 批量模式：需要关键图片的论文在一个任务中提交，结果写入 ArxivPaper.key_images 的缓存
+    只提交邮件预算中分配了图片的论文
+    """
+    papers = [p for p, item in zip(papers, plan_email(len(papers))) if item['figure']]
+    mineru_token = os.getenv('MINERU_TOKEN')
+    qwen_api_key = os.getenv('QWEN_API_KEY')
+    if not papers or not mineru_token or not qwen_api_key:
+        return
+    from image_analyzer import get_image_analyzer
+    analyzer = get_image_analyzer(mineru_token, qwen_api_key)
+    results = analyzer.extract_and_score_batch(
+        [{'pdf_url': p.pdf_url, 'title': p.title, 'abstract': p.summary,
+          'arxiv_id': p.arxiv_id, 'version': p.version} for p in papers],
+        max_images=10, top_k=3, timeout=float(os.getenv('MINERU_TIMEOUT', '900')))
+    for p in papers:
+        p.__dict__['key_images'] = results.get(p.pdf_url)
+
 
 parser = argparse.ArgumentParser(description='Recommender system for academic papers')
 
@@ -204,17 +269,65 @@ if __name__ == '__main__':
             papers = papers[:args.max_paper_num]
         if args.use_llm_api:
             logger.info("Using OpenAI API as global LLM.")
-            set_global_llm(api_key=args.openai_api_key, base_url=args.openai_api_base, model=args.model_name, lang=args.language)
+            # 可选：多个 OpenAI 兼容接口（JSON 列表），请求按权重分配并在出错时自动切换
+            llm_endpoints = json.loads(os.getenv('LLM_ENDPOINTS') or '[]')
+            vision_llm_endpoints = json.loads(os.getenv('VISION_LLM_ENDPOINTS') or '[]')
+            set_global_llm(api_key=args.openai_api_key, base_url=args.openai_api_base, model=args.model_name, lang=args.language, endpoints=llm_endpoints)
             # 设置vision LLM（用于架构图分析）
             logger.info(f"Setting up vision LLM: {args.vision_model_name}")
-            set_global_vision_llm(api_key=args.openai_api_key, base_url=args.openai_api_base, model=args.vision_model_name, lang=args.language)
+            set_global_vision_llm(api_key=args.openai_api_key, base_url=args.openai_api_base, model=args.vision_model_name, lang=args.language, endpoints=vision_llm_endpoints)
         else:
             logger.info("Using Local LLM as global LLM.")
             set_global_llm(lang=args.language)
             logger.warning("Vision LLM requires API mode. Architecture figures will be skipped in local mode.")
+        # 模型分级：标签、单位等简单抽取任务可以交给小模型（或 local 表示本地模型），TLDR 仍使用 MODEL_NAME
+        for task, env_name in [('tags', 'TAGS_MODEL'), ('affiliations', 'AFFILIATION_MODEL')]:
+            task_model = os.getenv(env_name)
+            if not task_model:
+                continue
+            logger.info(f"Using {task_model} for {task}.")
+            if task_model.lower() == 'local':
+                set_task_llm(task, LLM(lang=args.language))
+            elif args.use_llm_api:
+                set_task_llm(task, LLM(api_key=args.openai_api_key, base_url=args.openai_api_base, model=task_model, lang=args.language))
+            else:
+                logger.warning(f"{env_name} requires API mode, using the local LLM for {task}.")
+        # API 模式下并发请求数由自适应并发控制器进一步限制
+        enrich_workers = int(os.getenv('ENRICH_WORKERS', '0'))
+        if not enrich_workers and not args.use_llm_api:
+            # 本地多进程推理池模式下，默认按 worker 数并发分发请求
+            enrich_workers = int(os.getenv('LOCAL_LLM_WORKERS', '1'))
+            if enrich_workers == 0:
+                from llama_pool import get_llama_pool
+                enrich_workers = get_llama_pool().n_workers
+        enrich_mode = os.getenv('ENRICH_MODE', 'online').lower()
+        if enrich_mode == 'batch' and args.use_llm_api:
+            # Batch API 模式：延迟不敏感的任务一次性提交，成本更低；未完成的字段渲染时回退到在线请求
+            logger.info("Enriching papers with Batch API...")
+            batch_client = OpenAI(api_key=args.openai_api_key, base_url=os.getenv('BATCH_API_BASE', args.openai_api_base))
+            enrich_papers_with_batch(papers, batch_client, args.model_name, get_enrichment_fields(papers),
+                                     poll_interval=float(os.getenv('BATCH_POLL_INTERVAL', '30')),
+                                     timeout=float(os.getenv('BATCH_TIMEOUT', str(24 * 3600))))
+        elif enrich_mode == 'batch':
+            logger.warning("Batch enrichment requires API mode. Falling back to online enrichment.")
+        if enrich_workers > 1:
+            logger.info(f"Enriching papers with {enrich_workers} concurrent workers...")
+            enrich_papers(papers, get_enrichment_fields(papers), enrich_workers)
+        if os.getenv('ENABLE_TAGS', 'true').lower() == 'true' and os.getenv('TAGS_BACKEND', 'llm').lower() == 'embedding':
+            # 复用排序使用的句向量模型，所有论文一次性编码
+            logger.info("Extracting tags with the embedding model...")
+            tag_papers([p for p, item in zip(papers, plan_email(len(papers))) if item['summary']], get_embedding_model())
+        if (os.getenv('IMAGE_EXTRACTION_MODE', 'vision_llm').lower() == 'mineru'
+                and os.getenv('ENABLE_OVERVIEW_FIGURE', 'true').lower() == 'true'
+                and os.getenv('MINERU_BATCH', 'true').lower() == 'true'):
+            logger.info("Extracting key images with MinerU batch mode...")
+            prefetch_key_images(papers)
 
-    html = render_email(papers)
+    html, inline_images = render_email(papers)
+    report_llm_usage()
+    report_affiliation_stats()
+    report_caches()
     logger.info("Sending email...")
-    send_email(args.sender, args.receiver, args.sender_password, args.smtp_server, args.smtp_port, html)
+    send_email(args.sender, args.receiver, args.sender_password, args.smtp_server, args.smtp_port, html, inline_images)
     logger.success("Email sent successfully! If you don't receive the email, please check the configuration and the junk box.")
 
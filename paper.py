@@ -5,17 +5,22 @@ import arxiv
 import tarfile
 import re
 import time
+import ast
+import json
 from llm import get_llm, get_vision_llm
+from rate_limiter import CircuitOpenError
 import requests
 from requests.adapters import HTTPAdapter, Retry
 from loguru import logger
-import tiktoken
+from prompt_builder import PromptBuilder
+from latex_compress import compress_latex
+from image_utils import encode_image
+from pdf_raster import rasterize_pdf
+from tar_index import TarMemberIndex, parse_graphicspath
+from disk_cache import get_cache
+from affiliation_parser import extract_affiliations, record as record_affiliation_source
 from contextlib import ExitStack
 from urllib.error import HTTPError
-import base64
-import io
-from PIL import Image
-import subprocess
 import os
 
 # 导入图片分析模块（可选，用于 mineru 模式）
@@ -26,6 +31,28 @@ except ImportError:
     get_image_analyzer = None
 
 
+TAGS_MAX_ITEMS = 8
+
+
+def parse_string_list(response: str) -> list[str]:
+    """
+    从模型输出中解析字符串列表：本地模型在语法约束下直接输出 JSON，其余情况提取第一个 [...] 后解析
+    :raises ValueError: 找不到列表或列表无法解析
+    """
+    match = re.search(r'\[.*?\]', response, flags=re.DOTALL)
+    if match is None:
+        raise ValueError("no list found in response")
+    text = match.group(0)
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        # 兼容单引号等 Python 字面量写法
+        items = ast.literal_eval(text)
+    if not isinstance(items, list):
+        raise ValueError("response is not a list")
+    return [str(item).strip() for item in items]
+
+
 class ArxivPaper:
     def __init__(self,paper:arxiv.Result):
         self._paper = paper
@@ -47,6 +74,12 @@ class ArxivPaper:
     def arxiv_id(self) -> str:
         return re.sub(r'v\d+$', '', self._paper.get_short_id())
     
+    @property
+    def version(self) -> Optional[str]:
+        """arXiv 版本号（如 v2），无法确定时返回 None"""
+        match = re.search(r'v\d+$', self._paper.get_short_id())
+        return match.group(0) if match else None
+
     @property
     def pdf_url(self) -> str:
         if self._paper.pdf_url is not None:
@@ -258,8 +291,7 @@ class ArxivPaper:
                 file_contents["all"] = None
         return file_contents
     
-    @cached_property
-    def tldr(self) -> str:
+    def _tldr_messages(self) -> list[dict]:
         introduction = ""
         conclusion = ""
         if self.tex is not None:
@@ -280,7 +312,16 @@ class ArxivPaper:
             match = re.search(r'\\section\{Conclusion\}.*?(\\section|\\end\{document\}|\\bibliography|\\appendix|$)', content, flags=re.DOTALL)
             if match:
                 conclusion = match.group(0)
-        llm = get_llm()
+            # 去掉公式、引用、排版命令等 LaTeX 噪声，让预算留给正文
+            # 只用字符数估算压缩效果，避免为一条日志对整段正文做完整的 tokenize
+            raw_chars = len(introduction) + len(conclusion)
+            introduction = compress_latex(introduction)
+            conclusion = compress_latex(conclusion)
+            if raw_chars:
+                compressed_chars = len(introduction) + len(conclusion)
+                logger.debug(f"LaTeX compression for {self.arxiv_id}: {raw_chars} -> {compressed_chars} chars "
+                             f"({1 - compressed_chars / raw_chars:.0%} saved)")
+        llm = get_llm('tldr')
         prompt = """Given the title, abstract, introduction and the conclusion (if any) of a paper in latex format, generate a one-sentence TLDR summary in __LANG__:
 
         \\title{__TITLE__}
@@ -289,133 +330,205 @@ class ArxivPaper:
         __CONCLUSION__
         """
         prompt = prompt.replace('__LANG__', llm.lang)
-        prompt = prompt.replace('__TITLE__', self.title)
-        prompt = prompt.replace('__ABSTRACT__', self.summary)
-        prompt = prompt.replace('__INTRODUCTION__', introduction)
-        prompt = prompt.replace('__CONCLUSION__', conclusion)
-
-        # use gpt-4o tokenizer for estimation
-        enc = tiktoken.encoding_for_model("gpt-4o")
-        prompt_tokens = enc.encode(prompt)
-        prompt_tokens = prompt_tokens[:4000]  # truncate to 4000 tokens
-        prompt = enc.decode(prompt_tokens)
-
-        tldr = llm.generate(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an assistant who perfectly summarizes scientific paper, and gives the core idea of the paper to the user.",
-                },
-                {"role": "user", "content": prompt},
-            ]
-        )
-        return tldr
+        # 在 4000 tokens 预算内按段落分配，标题和摘要优先完整保留，结论不会被截掉
+        builder = PromptBuilder(prompt, max_tokens=4000, name=f"TLDR {self.arxiv_id}")
+        builder.add_section('TITLE', self.title, weight=4)
+        builder.add_section('ABSTRACT', self.summary, weight=4)
+        builder.add_section('INTRODUCTION', introduction, weight=2)
+        builder.add_section('CONCLUSION', conclusion, weight=1)
+        prompt = builder.build()
+
+        return [
+            {
+                "role": "system",
+                "content": "You are an assistant who perfectly summarizes scientific paper, and gives the core idea of the paper to the user.",
+            },
+            {"role": "user", "content": prompt},
+        ]
 
     @cached_property
-    def tags(self) -> list[str]:
-        """
-        从论文中提取关键技术词汇作为标签
-        """
-        llm = get_llm()
+    def tldr(self) -> str:
+        llm = get_llm('tldr')
+        try:
+            tldr = llm.generate(messages=self._tldr_messages())
+        except Exception as e:
+            # 重试耗尽或接口熔断时降级为摘要的第一句话，不阻塞整个运行
+            reason = "LLM circuit is open" if isinstance(e, CircuitOpenError) else f"TLDR generation failed ({e})"
+            logger.warning(f"{reason}, using abstract-only TLDR for {self.arxiv_id}")
+            tldr = re.split(r'(?<=[.!?])\s+', self.summary.strip(), maxsplit=1)[0]
+        return tldr
 
-        # 准备用于提取标签的内容（标题+摘要，如果有tex则加上introduction的前部分）
-        content_for_tags = f"Title: {self.title}\n\nAbstract: {self.summary}"
+    def introduction_excerpt(self, max_chars: int = 1000) -> str:
+        """LaTeX 源码中 introduction 的前 max_chars 个字符，没有源码时返回空字符串"""
+        if self.tex is None:
+            return ""
+        tex_content = self.tex.get("all")
+        if tex_content is None:
+            tex_content = "\n".join(self.tex.values())
+        match = re.search(r'\\section\{Introduction\}(.*?)(\\section|\\end\{document\}|\\bibliography|\\appendix|$)', tex_content, flags=re.DOTALL)
+        return compress_latex(match.group(1))[:max_chars] if match else ""
 
-        if self.tex is not None:
-            tex_content = self.tex.get("all")
-            if tex_content is None:
-                tex_content = "\n".join(self.tex.values())
+    def _tags_messages(self) -> list[dict]:
+        llm = get_llm('tags')
 
-            # 提取introduction的前1000个字符
-            match = re.search(r'\\section\{Introduction\}(.*?)(\\section|\\end\{document\}|\\bibliography|\\appendix|$)', tex_content, flags=re.DOTALL)
-            if match:
-                intro = match.group(1)[:1000]
-                content_for_tags += f"\n\nIntroduction (excerpt): {intro}"
+        # 准备用于提取标签的内容（标题+摘要，如果有tex则加上introduction的前部分）
+        introduction = self.introduction_excerpt()
+        if introduction:
+            introduction = f"\n\nIntroduction (excerpt): {introduction}"
 
         prompt = f"""Given the following research paper information, extract 5-8 key technical terms or concepts as tags. The tags should be in {llm.lang} and represent the main techniques, methods, datasets, or concepts discussed in the paper.
 
-{content_for_tags}
+Title: __TITLE__
+
+Abstract: __ABSTRACT____INTRODUCTION__
 
 Please return ONLY a Python list of strings (e.g., ['tag1', 'tag2', 'tag3']), without any additional explanation. Each tag should be concise (2-6 words)."""
 
-        # use gpt-4o tokenizer for estimation
-        enc = tiktoken.encoding_for_model("gpt-4o")
-        prompt_tokens = enc.encode(prompt)
-        prompt_tokens = prompt_tokens[:2000]  # 标签提取用更少的tokens
-        prompt = enc.decode(prompt_tokens)
+        # 标签提取用更少的tokens，预算优先保证标题和摘要
+        builder = PromptBuilder(prompt, max_tokens=2000, name=f"Tags {self.arxiv_id}")
+        builder.add_section('TITLE', self.title, weight=4)
+        builder.add_section('ABSTRACT', self.summary, weight=4)
+        builder.add_section('INTRODUCTION', introduction, weight=1)
+        prompt = builder.build()
+
+        return [
+            {
+                "role": "system",
+                "content": f"You are an expert at extracting key technical terms from research papers. You always return results in {llm.lang}. You return ONLY a Python list format, nothing else.",
+            },
+            {"role": "user", "content": prompt},
+        ]
 
-        try:
-            tags_response = llm.generate(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"You are an expert at extracting key technical terms from research papers. You always return results in {llm.lang}. You return ONLY a Python list format, nothing else.",
-                    },
-                    {"role": "user", "content": prompt},
-                ]
-            )
+    def _parse_tags(self, tags_response: str) -> list[str]:
+        # 提取返回结果中的列表，无法解析时抛出 ValueError / SyntaxError，由调用方决定如何降级
+        tags_list = parse_string_list(tags_response)
+        # 限制标签数量为5-8个
+        return tags_list[:TAGS_MAX_ITEMS]
 
-            # 提取返回结果中的列表
-            tags_match = re.search(r'\[.*?\]', tags_response, flags=re.DOTALL)
-            if tags_match:
-                tags_list = eval(tags_match.group(0))
-                tags_list = [str(tag).strip() for tag in tags_list]
-                # 限制标签数量为5-8个
-                return tags_list[:8]
-            else:
-                logger.debug(f"Failed to extract tags from LLM response for {self.arxiv_id}")
-                return []
+    @cached_property
+    def tags(self) -> list[str]:
+        """
+        从论文中提取关键技术词汇作为标签
+        """
+        llm = get_llm('tags')
+        try:
+            tags_response = llm.generate_list(messages=self._tags_messages(),
+                                              max_tokens=int(os.getenv('TAGS_MAX_TOKENS', '256')),
+                                              max_items=TAGS_MAX_ITEMS)
+            return self._parse_tags(tags_response)
         except Exception as e:
             logger.debug(f"Failed to extract tags for {self.arxiv_id}: {e}")
             return []
 
     @cached_property
-    def affiliations(self) -> Optional[list[str]]:
-        if self.tex is not None:
-            content = self.tex.get("all")
-            if content is None:
-                content = "\n".join(self.tex.values())
-            #search for affiliations
-            possible_regions = [r'\\author.*?\\maketitle',r'\\begin{document}.*?\\begin{abstract}']
-            matches = [re.search(p, content, flags=re.DOTALL) for p in possible_regions]
-            match = next((m for m in matches if m), None)
-            if match:
-                information_region = match.group(0)
-            else:
-                logger.debug(f"Failed to extract affiliations of {self.arxiv_id}: No author information found.")
-                return None
-            prompt = f"Given the author information of a paper in latex format, extract the affiliations of the authors in a python list format, which is sorted by the author order. If there is no affiliation found, return an empty list '[]'. Following is the author information:\n{information_region}"
-            # use gpt-4o tokenizer for estimation
-            enc = tiktoken.encoding_for_model("gpt-4o")
-            prompt_tokens = enc.encode(prompt)
-            prompt_tokens = prompt_tokens[:4000]  # truncate to 4000 tokens
-            prompt = enc.decode(prompt_tokens)
-            llm = get_llm()
-            affiliations = llm.generate(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an assistant who perfectly extracts affiliations of authors from the author information of a paper. You should return a python list of affiliations sorted by the author order, like ['TsingHua University','Peking University']. If an affiliation is consisted of multi-level affiliations, like 'Department of Computer Science, TsingHua University', you should return the top-level affiliation 'TsingHua University' only. Do not contain duplicated affiliations. If there is no affiliation found, you should return an empty list [ ]. You should only return the final list of affiliations, and do not return any intermediate results.",
-                    },
-                    {"role": "user", "content": prompt},
-                ]
-            )
+    def _author_region(self) -> Optional[str]:
+        """LaTeX 源码中的作者信息区域"""
+        if self.tex is None:
+            return None
+        content = self.tex.get("all")
+        if content is None:
+            content = "\n".join(self.tex.values())
+        #search for affiliations
+        possible_regions = [r'\\author.*?\\maketitle',r'\\begin{document}.*?\\begin{abstract}']
+        matches = [re.search(p, content, flags=re.DOTALL) for p in possible_regions]
+        match = next((m for m in matches if m), None)
+        if match:
+            return match.group(0)
+        logger.debug(f"Failed to extract affiliations of {self.arxiv_id}: No author information found.")
+        return None
 
-            try:
-                affiliations = re.search(r'\[.*?\]', affiliations, flags=re.DOTALL).group(0)
-                affiliations = eval(affiliations)
-                affiliations = list(set(affiliations))
-                affiliations = [str(a) for a in affiliations]
-            except Exception as e:
-                logger.debug(f"Failed to extract affiliations of {self.arxiv_id}: {e}")
-                return None
+    @cached_property
+    def _rule_affiliations(self) -> Optional[list[str]]:
+        """
+        先用规则解析 \\affiliation / \\institute / \\affil 等宏，解析不到时返回 None，由 LLM 处理
+        """
+        if self._author_region is None:
+            return None
+        affiliations = extract_affiliations(self._author_region)
+        record_affiliation_source(rule_based=bool(affiliations))
+        if affiliations:
+            logger.debug(f"Parsed affiliations of {self.arxiv_id} by rules: {affiliations}")
             return affiliations
+        return None
+
+    def _affiliations_messages(self) -> Optional[list[dict]]:
+        information_region = self._author_region
+        if information_region is None or self._rule_affiliations is not None:
+            return None
+        prompt = "Given the author information of a paper in latex format, extract the affiliations of the authors in a python list format, which is sorted by the author order. If there is no affiliation found, return an empty list '[]'. Following is the author information:\n__AUTHOR_INFO__"
+        builder = PromptBuilder(prompt, max_tokens=4000, name=f"Affiliations {self.arxiv_id}")
+        builder.add_section('AUTHOR_INFO', information_region)
+        prompt = builder.build()
+        return [
+            {
+                "role": "system",
+                "content": "You are an assistant who perfectly extracts affiliations of authors from the author information of a paper. You should return a python list of affiliations sorted by the author order, like ['TsingHua University','Peking University']. If an affiliation is consisted of multi-level affiliations, like 'Department of Computer Science, TsingHua University', you should return the top-level affiliation 'TsingHua University' only. Do not contain duplicated affiliations. If there is no affiliation found, you should return an empty list [ ]. You should only return the final list of affiliations, and do not return any intermediate results.",
+            },
+            {"role": "user", "content": prompt},
+        ]
+
+    def _parse_affiliations(self, affiliations: str) -> list[str]:
+        # 无法解析时抛出 ValueError / SyntaxError
+        return list(set(parse_string_list(affiliations)))
+
+    @cached_property
+    def affiliations(self) -> Optional[list[str]]:
+        if self._rule_affiliations is not None:
+            return self._rule_affiliations
+        messages = self._affiliations_messages()
+        if messages is None:
+            return None
+        llm = get_llm('affiliations')
+        try:
+            affiliations = llm.generate_list(messages=messages,
+                                             max_tokens=int(os.getenv('AFFILIATIONS_MAX_TOKENS', '512')))
+        except Exception as e:
+            reason = "LLM circuit is open" if isinstance(e, CircuitOpenError) else f"affiliation extraction failed ({e})"
+            logger.warning(f"{reason}, skipping affiliations of {self.arxiv_id}")
+            return None
+        try:
+            return self._parse_affiliations(affiliations)
+        except (ValueError, SyntaxError) as e:
+            logger.debug(f"Failed to extract affiliations of {self.arxiv_id}: {e}")
+            return None
+
+    def enrichment_messages(self, field: str) -> Optional[list[dict]]:
+        """
+        获取 LLM 增强字段（tldr / tags / affiliations）的请求消息，无需请求时返回 None
+        """
+        return {
+            'tldr': self._tldr_messages,
+            'tags': self._tags_messages,
+            'affiliations': self._affiliations_messages,
+        }[field]()
+
+    def set_enrichment(self, field: str, response: str) -> bool:
+        """
+        将外部获得的 LLM 响应（如 Batch API 结果）解析后写入对应字段的缓存
+        解析失败（或 TLDR 为空）时不写入，渲染时会回退到在线请求
+        :return: 是否写入
+        """
+        def parse_tldr(r: str) -> str:
+            if not r or not r.strip():
+                raise ValueError("empty TLDR")
+            return r
+        parsers = {
+            'tldr': parse_tldr,
+            'tags': self._parse_tags,
+            'affiliations': self._parse_affiliations,
+        }
+        try:
+            self.__dict__[field] = parsers[field](response)
+        except Exception as e:
+            logger.debug(f"Failed to parse {field} for {self.arxiv_id}: {e}")
+            return False
+        return True
 
     @cached_property
     def overview_figure(self) -> Optional[dict]:
         """
         提取论文的overview/architecture图片并生成描述
-        返回: {"image_base64": str, "caption": str, "description": str} 或 None
+        返回: {"image_base64": str, "image_mime": str, "caption": str, "description": str} 或 None
         """
         if self.tex is None:
             logger.debug(f"No LaTeX source available for {self.arxiv_id}, skipping overview figure extraction.")
@@ -553,73 +666,29 @@ Please return ONLY a Python list of strings (e.g., ['tag1', 'tag2', 'tag3']), wi
                     logger.debug(f"No image file found in target figure for {self.arxiv_id}")
                     return None
 
-                # 清理文件名（移除路径、添加常见扩展名）
-                image_file = image_file.strip().replace('./', '')
+                image_file = image_file.strip()
                 logger.debug(f"Looking for image file: {image_file}")
 
-                # 列出tar中所有文件用于调试和模糊匹配
-                all_files = tar.getnames()
-                image_files_in_tar = [f for f in all_files if any(f.lower().endswith(ext) for ext in ['.png', '.pdf', '.jpg', '.jpeg', '.eps'])]
-                logger.debug(f"Available image files in tar: {image_files_in_tar[:10]}")  # 只显示前10个
-
-                # 尝试多种可能的路径和扩展名
-                possible_paths = []
-
-                # 1. 原始路径 + 各种扩展名
-                base_name = re.sub(r'\.\w+$', '', image_file)  # 移除现有扩展名
-                for ext in ['', '.png', '.pdf', '.jpg', '.jpeg', '.PNG', '.PDF', '.JPG']:
-                    possible_paths.append(base_name + ext if ext else image_file)
-
-                # 2. 只保留文件名（去掉所有路径）
-                filename_only = image_file.split('/')[-1]
-                base_filename = re.sub(r'\.\w+$', '', filename_only)
-                for ext in ['', '.png', '.pdf', '.jpg', '.jpeg', '.PNG', '.PDF', '.JPG']:
-                    possible_paths.append(base_filename + ext if ext else filename_only)
-
-                # 3. 模糊匹配：在tar中查找包含文件名的图片
-                for tar_file in image_files_in_tar:
-                    if base_filename.lower() in tar_file.lower():
-                        possible_paths.append(tar_file)
-
-                image_data = None
-                found_file = None
-
-                for try_filename in possible_paths:
-                    try:
-                        extracted_file = tar.extractfile(try_filename)
-                        if extracted_file:
-                            image_data = extracted_file.read()
-                            found_file = try_filename
-                            logger.debug(f"Successfully extracted {try_filename} for {self.arxiv_id}")
-                            break
-                    except KeyError:
-                        continue
-
-                if image_data is None:
-                    logger.warning(f"Image file {image_file} not found in tar for {self.arxiv_id}. Tried {len(possible_paths)} variations.")
+                # 一次性建立成员索引，按 \graphicspath 和扩展名规则查找图片
+                index = TarMemberIndex(tar)
+                member = index.resolve(image_file, parse_graphicspath(content))
+                if member is None:
+                    logger.warning(f"Image file {image_file} not found in tar for {self.arxiv_id}. "
+                                   f"Available image files: {[m.name for m in index.image_members][:10]}")
                     return None
+                found_file = member.name
+                image_data = index.read(member)
+                logger.debug(f"Successfully extracted {found_file} for {self.arxiv_id}")
 
-                # 如果是PDF，转换为PNG
+                # 如果是PDF，按目标尺寸渲染为PNG
                 if found_file and found_file.lower().endswith('.pdf'):
-                    try:
-                        # 保存PDF到临时文件
-                        pdf_path = f"{tmpdirname}/temp.pdf"
-                        with open(pdf_path, 'wb') as f:
-                            f.write(image_data)
-
-                        # 使用pdftoppm转换（如果可用）
-                        png_path = f"{tmpdirname}/temp.png"
-                        subprocess.run(['pdftoppm', '-png', '-singlefile', pdf_path, f"{tmpdirname}/temp"],
-                                      check=True, capture_output=True)
-
-                        with open(png_path, 'rb') as f:
-                            image_data = f.read()
-                    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-                        logger.warning(f"Failed to convert PDF to PNG for {self.arxiv_id}: {e}. Skipping this figure.")
+                    image_data = rasterize_pdf(image_data)
+                    if image_data is None:
+                        logger.warning(f"Failed to convert PDF to PNG for {self.arxiv_id}. Skipping this figure.")
                         return None
 
-                # 转换为base64
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
+                # 缩放并重新编码后转为base64，减小 vision 请求和邮件的体积
+                image_base64, image_mime = encode_image(image_data)
 
                 # 使用vision LLM生成描述
                 vision_llm = get_vision_llm()
@@ -640,13 +709,31 @@ Keep it concise and technical."""
                     logger.warning(f"SKIP_VISION_LLM is enabled, skipping vision description for {self.arxiv_id}")
                     description = target_caption  # 直接使用 caption
                 else:
-                    try:
-                        logger.debug(f"Calling Vision LLM for {self.arxiv_id}")
-                        description = vision_llm.generate_with_vision(prompt, image_base64)
-                        logger.debug(f"Vision LLM succeeded for {self.arxiv_id}")
-                    except Exception as e:
-                        logger.error(f"Failed to generate vision description for {self.arxiv_id}: {e}")
-                        description = target_caption  # 回退到使用原始caption
+                    # 相同图片、prompt 和模型的描述直接复用缓存；多接口路由时按实际回答的模型写入，
+                    # 查找时依次尝试各接口的模型
+                    vision_cache = get_cache('vision')
+                    description = None
+                    for model in vision_llm.models:
+                        description = vision_cache.get(vision_cache.key(image_base64, prompt, model))
+                        if description:
+                            break
+                    if description:
+                        logger.debug(f"Using cached vision description for {self.arxiv_id}")
+                    else:
+                        try:
+                            logger.debug(f"Calling Vision LLM for {self.arxiv_id}")
+                            description, model = vision_llm.generate_with_vision(prompt, image_base64, image_mime,
+                                                                                 with_model=True)
+                            if description and description.strip():
+                                logger.debug(f"Vision LLM succeeded for {self.arxiv_id}")
+                                vision_cache.set(vision_cache.key(image_base64, prompt, model), description)
+                            else:
+                                # 空描述不写缓存，下次运行重新生成
+                                logger.warning(f"Vision LLM returned an empty description for {self.arxiv_id}")
+                                description = target_caption
+                        except Exception as e:
+                            logger.error(f"Failed to generate vision description for {self.arxiv_id}: {e}")
+                            description = target_caption  # 回退到使用原始caption
 
                 # 清理caption（移除LaTeX命令）
                 # 清理 caption：移除 LaTeX 命令和引用
@@ -664,6 +751,7 @@ Keep it concise and technical."""
 
                 return {
                     "image_base64": image_base64,
+                    "image_mime": image_mime,
                     "caption": clean_caption,
                     "description": description
                 }
@@ -704,6 +792,8 @@ Keep it concise and technical."""
                 pdf_url=self.pdf_url,
                 paper_title=self.title,
                 paper_abstract=self.summary,
+                paper_id=self.arxiv_id,
+                paper_version=self.version,
                 max_images=10,  # 最多提取10张图片进行评分
                 top_k=3         # 返回最重要的3张图片
             )
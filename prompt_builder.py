@@ -0,0 +1,114 @@
+from functools import lru_cache
+from loguru import logger
+import tiktoken
+
+# 粗略估计：英文/LaTeX 文本平均约 4 个字符对应 1 个 token
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = "gpt-4o"):
+    """
+    获取进程内共享的 tokenizer（只加载一次，所有论文复用）
+    """
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoder().encode(text))
+
+
+def _encode_prefix(text: str, max_tokens: int) -> tuple[list[int], bool]:
+    """
+    只编码文本中可能用得到的前缀部分，避免对超长 LaTeX 全文做完整编码
+    :return: (前缀的 token 列表, 前缀是否覆盖了整个文本)
+    """
+    # 按字符估计放大 2 倍作为前缀长度，足以覆盖 max_tokens 个 token
+    char_limit = max_tokens * CHARS_PER_TOKEN * 2
+    return get_encoder().encode(text[:char_limit]), len(text) <= char_limit
+
+
+class PromptBuilder:
+    """
+    在 token 预算内构造 prompt：
+    模板中的固定文本按实际 token 计数，剩余预算按权重在各个段落（标题、摘要、引言、结论等）之间分配，
+    放得下的短段落完整保留，多出的预算再分给长段落，避免像直接截断整个 prompt 那样总是丢掉结尾（如结论）。
+    """
+
+    def __init__(self, template: str, max_tokens: int, name: str = "prompt"):
+        """
+        :param template: 包含 __KEY__ 形式占位符的 prompt 模板
+        :param max_tokens: 整个 prompt 的 token 上限
+        :param name: 用于日志的名称
+        """
+        self.template = template
+        self.max_tokens = max_tokens
+        self.name = name
+        self.sections: dict[str, tuple[str, float]] = {}
+        self.section_tokens: dict[str, int] = {}
+        self.prompt_tokens = 0
+
+    def add_section(self, key: str, text: str, weight: float = 1.0) -> "PromptBuilder":
+        """
+        添加一个段落，key 对应模板中的 __KEY__ 占位符；weight 越大，预算不足时分到的 token 越多
+        """
+        self.sections[key] = (text or "", weight)
+        return self
+
+    def _fixed_text(self) -> str:
+        fixed = self.template
+        for key in self.sections:
+            fixed = fixed.replace(f"__{key}__", "")
+        return fixed
+
+    def _allocate(self, sizes: dict[str, int], budget: int) -> dict[str, int]:
+        """
+        按权重进行注水式分配：需求不超过应得份额的段落完整保留，剩余预算在其他段落之间重新分配
+        """
+        allocation = {}
+        pending = {k: v for k, v in sizes.items() if v > 0}
+        while pending:
+            total_weight = sum(self.sections[k][1] for k in pending)
+            if total_weight <= 0:
+                break
+            satisfied = {k: v for k, v in pending.items()
+                         if v <= budget * self.sections[k][1] / total_weight}
+            if not satisfied:
+                for k in pending:
+                    allocation[k] = int(budget * self.sections[k][1] / total_weight)
+                break
+            for k, v in satisfied.items():
+                allocation[k] = v
+                budget -= v
+                del pending[k]
+        return allocation
+
+    def build(self) -> str:
+        fixed_tokens = count_tokens(self._fixed_text())
+        budget = max(self.max_tokens - fixed_tokens, 0)
+
+        # 段落只编码有可能被用到的前缀，超长正文不会被完整编码
+        encoded = {key: _encode_prefix(text, budget) for key, (text, _) in self.sections.items()}
+        # 前缀未覆盖全文的段落必然超出预算
+        sizes = {key: len(tokens) if complete else max(len(tokens), budget + 1)
+                 for key, (tokens, complete) in encoded.items()}
+        allocation = self._allocate(sizes, budget)
+
+        prompt = self.template
+        truncated = []
+        for key, (text, _) in self.sections.items():
+            limit = allocation.get(key, 0)
+            tokens, _ = encoded[key]
+            if limit < sizes[key]:
+                text = get_encoder().decode(tokens[:limit])
+                truncated.append(key.lower())
+            self.section_tokens[key] = min(limit, len(tokens))
+            prompt = prompt.replace(f"__{key}__", text)
+
+        self.prompt_tokens = fixed_tokens + sum(self.section_tokens.values())
+        logger.debug(
+            f"{self.name} prompt: {self.prompt_tokens}/{self.max_tokens} tokens (fixed={fixed_tokens}, "
+            + ", ".join(f"{k.lower()}={v}" for k, v in self.section_tokens.items()) + ")"
+            + (f", truncated: {', '.join(truncated)}" if truncated else "")
+        )
+        return prompt
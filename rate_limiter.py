@@ -0,0 +1,200 @@
+"""
+LLM 接口的自适应并发控制
+
+- 解析 Retry-After / x-ratelimit-* 响应头，在服务端要求的时间之前暂停所有请求
+- 按 AIMD 调整允许同时进行的请求数：成功且延迟正常时加性增加，遇到 429 或延迟过高时乘性减少
+- 连续失败达到阈值后熔断，熔断期间请求直接失败（CircuitOpenError），调用方降级处理而不是阻塞整个运行
+"""
+import email.utils
+import os
+import re
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from loguru import logger
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求未发送"""
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """解析 OpenAI 风格的时长，如 '20ms'、'1s'、'6m0s'、'1h2m3.5s'"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts:
+        return None
+    scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(n) * scale[unit] for n, unit in parts)
+
+
+def wait_time_from_headers(headers) -> Optional[float]:
+    """
+    根据限流相关的响应头计算需要等待的秒数，没有相关信息时返回 None
+    """
+    if not headers:
+        return None
+    if (ms := headers.get('retry-after-ms')) is not None:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    if (retry_after := headers.get('retry-after')) is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                date = email.utils.parsedate_to_datetime(retry_after)
+                return max(date.timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    # 配额耗尽时等待到重置时间
+    for kind in ('requests', 'tokens'):
+        remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+        reset = headers.get(f'x-ratelimit-reset-{kind}')
+        if remaining is not None and reset is not None and remaining.strip() == '0':
+            return _parse_duration(reset)
+    return None
+
+
+class AdaptiveConcurrencyController:
+    """
+    按 AIMD 调整并发上限，并在服务端要求时全局暂停；同一接口的所有 LLM 实例共享一个控制器
+    """
+
+    def __init__(self, name: str, initial_limit: float = 4, min_limit: float = 1, max_limit: float = 32,
+                 latency_target: float = 30.0, failure_threshold: int = 5, cooldown: float = 60.0):
+        """
+        :param name: 接口名称（用于日志）
+        :param initial_limit: 初始并发上限
+        :param min_limit: 并发上限的下界
+        :param max_limit: 并发上限的上界
+        :param latency_target: 单次请求的目标延迟（秒），超过则视为拥塞
+        :param failure_threshold: 连续失败多少次后熔断
+        :param cooldown: 熔断持续时间（秒），之后允许一个试探请求
+        """
+        self.name = name
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._probing = False
+        self.stats = {'requests': 0, 'rate_limited': 0, 'failures': 0, 'rejected': 0}
+
+    @property
+    def is_open(self) -> bool:
+        return self._consecutive_failures >= self.failure_threshold and time.monotonic() < self._open_until
+
+    @contextmanager
+    def slot(self):
+        """
+        获取一个并发名额；熔断打开时抛出 CircuitOpenError
+        """
+        probe = False
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._consecutive_failures >= self.failure_threshold and not probe:
+                    if now < self._open_until or self._probing:
+                        self.stats['rejected'] += 1
+                        raise CircuitOpenError(f"Circuit for {self.name} is open")
+                    # 半开状态：只放行一个试探请求
+                    probe = self._probing = True
+                if now < self._blocked_until:
+                    self._cond.wait(self._blocked_until - now)
+                    continue
+                if self._in_flight < max(int(self.limit), 1):
+                    break
+                self._cond.wait()
+            self._in_flight += 1
+            self.stats['requests'] += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                if probe:
+                    self._probing = False
+                self._cond.notify_all()
+
+    def on_success(self, latency: float, headers=None):
+        with self._cond:
+            if self._consecutive_failures >= self.failure_threshold:
+                logger.info(f"Circuit for {self.name} closed again")
+            self._consecutive_failures = 0
+            if latency > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * 0.7)
+            else:
+                # 每个"往返"增加约 1 个名额
+                self.limit = min(self.max_limit, self.limit + 1 / max(self.limit, 1))
+            self._pause(wait_time_from_headers(headers))
+            self._cond.notify_all()
+
+    def on_rate_limited(self, headers=None) -> float:
+        """
+        记录一次 429，乘性减少并发上限，返回重试前需要等待的秒数
+        """
+        with self._cond:
+            self.stats['rate_limited'] += 1
+            self.limit = max(self.min_limit, self.limit / 2)
+            wait = wait_time_from_headers(headers)
+            if wait is None:
+                wait = min(60.0, 5 * 2 ** min(self.stats['rate_limited'], 4)) * random.uniform(0.5, 1.0)
+            self._pause(wait)
+            logger.warning(f"{self.name} rate limited, concurrency limit -> {self.limit:.1f}, pausing {wait:.1f}s")
+            return wait
+
+    def on_failure(self):
+        """记录一次最终失败（重试耗尽），连续失败达到阈值时熔断"""
+        with self._cond:
+            self.stats['failures'] += 1
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failure_threshold:
+                self._open_until = time.monotonic() + self.cooldown
+                logger.error(f"Circuit for {self.name} opened for {self.cooldown:.0f}s after "
+                             f"{self._consecutive_failures} consecutive failures")
+
+    def _pause(self, wait: Optional[float]):
+        if wait:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + wait)
+
+    def report(self) -> str:
+        return (f"{self.name}: {self.stats['requests']} requests, {self.stats['rate_limited']} rate limited, "
+                f"{self.stats['failures']} failed, {self.stats['rejected']} rejected by circuit breaker, "
+                f"final concurrency limit {self.limit:.1f}")
+
+
+_controllers: dict[str, AdaptiveConcurrencyController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(name: str) -> AdaptiveConcurrencyController:
+    """按接口名称（base_url）获取共享的控制器"""
+    with _controllers_lock:
+        if name not in _controllers:
+            _controllers[name] = AdaptiveConcurrencyController(
+                name,
+                initial_limit=float(os.getenv('LLM_CONCURRENCY', '4')),
+                max_limit=float(os.getenv('LLM_MAX_CONCURRENCY', '32')),
+                latency_target=float(os.getenv('LLM_LATENCY_TARGET', '30')),
+            )
+        return _controllers[name]
+
+
+def report_controllers():
+    for controller in _controllers.values():
+        logger.info(controller.report())
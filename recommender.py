@@ -2,9 +2,18 @@ import numpy as np
 from sentence_transformers import SentenceTransformer
 from paper import ArxivPaper
 from datetime import datetime
+from functools import lru_cache
 
-def rerank_paper(candidate:list[ArxivPaper],corpus:list[dict],model:str='avsolatorio/GIST-small-Embedding-v0') -> list[ArxivPaper]:
-    encoder = SentenceTransformer(model)
+DEFAULT_EMBEDDING_MODEL = 'avsolatorio/GIST-small-Embedding-v0'
+
+
+@lru_cache(maxsize=None)
+def get_embedding_model(model:str=DEFAULT_EMBEDDING_MODEL) -> SentenceTransformer:
+    """加载句向量模型（同一进程内只加载一次，排序与关键词标签共用）"""
+    return SentenceTransformer(model)
+
+def rerank_paper(candidate:list[ArxivPaper],corpus:list[dict],model:str=DEFAULT_EMBEDDING_MODEL) -> list[ArxivPaper]:
+    encoder = get_embedding_model(model)
     #sort corpus by date, from newest to oldest
     corpus = sorted(corpus,key=lambda x: datetime.strptime(x['data']['dateAdded'], '%Y-%m-%dT%H:%M:%SZ'),reverse=True)
     time_decay_weight = 1 / (1 + np.log10(np.arange(len(corpus)) + 1))
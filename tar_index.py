@@ -0,0 +1,91 @@
+"""
+arXiv 源码包的成员索引
+
+打开 tar 后一次性建立索引：规范化的小写路径 -> 成员，去掉扩展名的路径 -> 各扩展名的候选成员。
+\\includegraphics 的目标按 \\graphicspath 中的目录逐个做字典查找，不再逐个尝试路径变体调用
+tar.extractfile（每次都要线性扫描成员列表）。
+"""
+import posixpath
+import re
+import tarfile
+from typing import Optional
+
+# 同名不同扩展名时的优先顺序：位图可以直接使用，PDF 需要栅格化，EPS 最后
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.pdf', '.eps']
+
+
+def normalize_member_path(path: str) -> str:
+    """统一为小写、去掉 ./ 和多余分隔符的相对路径"""
+    path = posixpath.normpath(path.strip().replace('\\', '/')).lower()
+    return '' if path == '.' else path.lstrip('/')
+
+
+def parse_graphicspath(tex: str) -> list[str]:
+    """解析 \\graphicspath{{figures/}{img/}} 中的目录列表"""
+    paths = []
+    for match in re.finditer(r'\\graphicspath\s*\{((?:\s*\{[^{}]*\})+)\s*\}', tex or ''):
+        for path in re.findall(r'\{([^{}]*)\}', match.group(1)):
+            path = normalize_member_path(path)
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _split_image_extension(path: str) -> tuple[str, str]:
+    stem, ext = posixpath.splitext(path)
+    # 文件名中可能带点（如 fig.v2），只有图片扩展名才去掉
+    return (stem, ext) if ext in IMAGE_EXTENSIONS else (path, '')
+
+
+class TarMemberIndex:
+    """
+    源码包成员索引
+    """
+
+    def __init__(self, tar: tarfile.TarFile):
+        self.tar = tar
+        self.by_path: dict[str, tarfile.TarInfo] = {}
+        self.by_stem: dict[str, list[tarfile.TarInfo]] = {}
+        self.by_basename: dict[str, list[tarfile.TarInfo]] = {}
+        for member in tar.getmembers():
+            if not member.isfile():
+                continue
+            path = normalize_member_path(member.name)
+            self.by_path.setdefault(path, member)
+            stem, ext = _split_image_extension(path)
+            if ext:
+                self.by_stem.setdefault(stem, []).append(member)
+                self.by_basename.setdefault(posixpath.basename(stem), []).append(member)
+
+    @property
+    def image_members(self) -> list[tarfile.TarInfo]:
+        return [m for members in self.by_stem.values() for m in members]
+
+    @staticmethod
+    def _best(candidates: list[tarfile.TarInfo]) -> tarfile.TarInfo:
+        return min(candidates, key=lambda m: IMAGE_EXTENSIONS.index(posixpath.splitext(m.name.lower())[1]))
+
+    def resolve(self, name: str, graphicspaths: Optional[list[str]] = None) -> Optional[tarfile.TarInfo]:
+        """
+        按 LaTeX 的查找规则定位 \\includegraphics 的目标
+        :param name: \\includegraphics 的参数，可以省略扩展名
+        :param graphicspaths: \\graphicspath 中的目录，依次在这些目录下查找，最后查找源码根目录
+        :return: 对应的成员，找不到时返回 None
+        """
+        for prefix in (graphicspaths or []) + ['']:
+            path = normalize_member_path(posixpath.join(prefix, name.strip()))
+            stem, ext = _split_image_extension(path)
+            if ext and path in self.by_path:
+                return self.by_path[path]
+            if stem in self.by_stem:
+                return self._best(self.by_stem[stem])
+        # 路径对不上时（如主文件在子目录中），按文件名匹配，仅在唯一时采用
+        stem, _ = _split_image_extension(normalize_member_path(name))
+        candidates = self.by_basename.get(posixpath.basename(stem), [])
+        if len({posixpath.splitext(normalize_member_path(m.name))[0] for m in candidates}) == 1:
+            return self._best(candidates)
+        return None
+
+    def read(self, member: tarfile.TarInfo) -> bytes:
+        with self.tar.extractfile(member) as f:
+            return f.read()
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class ByteEncoder:
+    """按 UTF-8 字节切分的 tokenizer，测试中替代需要联网下载词表的 tiktoken"""
+
+    def encode(self, text: str, **kwargs) -> list[int]:
+        return list(text.encode('utf-8'))
+
+    def decode(self, tokens: list[int]) -> str:
+        return bytes(tokens).decode('utf-8', errors='ignore')
+
+
+@pytest.fixture(autouse=True)
+def offline_encoder(monkeypatch):
+    import prompt_builder
+    monkeypatch.setattr(prompt_builder, 'get_encoder', lambda model='gpt-4o': ByteEncoder())
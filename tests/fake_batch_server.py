@@ -0,0 +1,118 @@
+"""
+本地模拟的 OpenAI 兼容 Batch API 服务（/v1/files + /v1/batches），用于测试 Batch 增强模式
+
+batch 创建后立即完成：对输入文件中的每个请求调用 responder 得到回复内容，
+responder 返回 None 时该请求记为失败（status_code 500）。
+"""
+import email
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+class FakeBatchServer:
+    def __init__(self, responder: Callable[[dict], Optional[str]]):
+        """
+        :param responder: 输入一条 batch 请求（含 custom_id 和 body），返回回复内容或 None
+        """
+        self.responder = responder
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self.requests: list[dict] = []
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _file_object(self, file_id: str, purpose: str) -> dict:
+        return {"id": file_id, "object": "file", "bytes": len(self.files[file_id]), "created_at": 0,
+                "filename": f"{file_id}.jsonl", "purpose": purpose, "status": "processed"}
+
+    def _run_batch(self, batch: dict):
+        lines = []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            self.requests.append(request)
+            content = self.responder(request)
+            if content is None:
+                response = {"status_code": 500, "body": {"error": {"message": "stand-in failure"}}}
+            else:
+                response = {"status_code": 200, "body": {
+                    "id": f"chatcmpl-{len(lines)}", "object": "chat.completion", "created": 0,
+                    "model": request["body"]["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}]}}
+            lines.append(json.dumps({"id": f"req-{len(lines)}", "custom_id": request["custom_id"],
+                                     "response": response, "error": None}))
+        output_id = f"file-{len(self.files)}"
+        self.files[output_id] = "\n".join(lines).encode("utf-8")
+        batch.update(status="completed", output_file_id=output_id,
+                     request_counts={"total": len(lines), "completed": len(lines), "failed": 0})
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body, content_type: str = "application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):
+                body = self._body()
+                if self.path == "/v1/files":
+                    # multipart/form-data：file 字段为 JSONL 内容
+                    message = email.message_from_bytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+                    fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                              for part in message.get_payload()}
+                    file_id = f"file-{len(server.files)}"
+                    server.files[file_id] = fields["file"]
+                    self._send(200, server._file_object(file_id, fields["purpose"].decode()))
+                elif self.path == "/v1/batches":
+                    params = json.loads(body)
+                    batch = {"id": f"batch-{len(server.batches)}", "object": "batch", "endpoint": params["endpoint"],
+                             "input_file_id": params["input_file_id"], "completion_window": params["completion_window"],
+                             "status": "in_progress", "created_at": 0}
+                    server.batches[batch["id"]] = batch
+                    self._send(200, batch)
+                    server._run_batch(batch)
+                elif self.path.startswith("/v1/batches/") and self.path.endswith("/cancel"):
+                    batch = server.batches[self.path.split("/")[3]]
+                    batch["status"] = "cancelled"
+                    self._send(200, batch)
+                else:
+                    self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+            def do_GET(self):
+                parts = self.path.split("/")
+                if self.path.startswith("/v1/batches/"):
+                    self._send(200, server.batches[parts[3]])
+                elif self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+                    self._send(200, server.files[parts[3]], "application/octet-stream")
+                else:
+                    self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        return Handler
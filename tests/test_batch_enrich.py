@@ -0,0 +1,54 @@
+import arxiv
+import pytest
+from openai import OpenAI
+
+import llm
+from batch_enrich import enrich_papers_with_batch
+from paper import ArxivPaper
+from fake_batch_server import FakeBatchServer
+
+MODEL = "stand-in-model"
+
+
+def make_paper(idx: int) -> ArxivPaper:
+    result = arxiv.Result(entry_id=f"http://arxiv.org/abs/2501.0000{idx}v1", title=f"Paper {idx}",
+                          summary=f"Abstract of paper {idx}. It does something.", authors=[])
+    paper = ArxivPaper(result)
+    # 不下载源码：作者区域没有可被规则解析的单位，需要 LLM 提取
+    paper.__dict__['tex'] = {'all': f"\\author{{Alice {idx} \\and Bob {idx}}}\n\\maketitle"}
+    return paper
+
+
+def responder(request: dict):
+    idx, field = request["custom_id"].split(":")
+    if field == "tldr":
+        return None if idx == "1" else f"TLDR of paper {idx}"
+    if field == "tags":
+        return '["tag a", "tag b"]' if idx == "0" else "no list here"
+    if field == "affiliations":
+        return "['Stand-in University']"
+
+
+@pytest.fixture(autouse=True)
+def global_llm(monkeypatch):
+    monkeypatch.setattr(llm, "GLOBAL_LLM", None)
+    monkeypatch.setattr(llm, "TASK_LLMS", {})
+    llm.set_global_llm(api_key="test", base_url="http://127.0.0.1:9/v1", model=MODEL)
+
+
+def test_batch_enrichment_applies_parsed_results():
+    papers = [make_paper(0), make_paper(1)]
+    fields = [['tldr', 'tags', 'affiliations'], ['tldr', 'tags']]
+    with FakeBatchServer(responder) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url)
+        applied = enrich_papers_with_batch(papers, client, MODEL, fields, poll_interval=0.01, timeout=10)
+
+    assert sorted(r["custom_id"] for r in server.requests) == ['0:affiliations', '0:tags', '0:tldr', '1:tags', '1:tldr']
+    assert all(r["body"]["model"] == MODEL for r in server.requests)
+    assert applied == 3
+    assert papers[0].__dict__['tldr'] == "TLDR of paper 0"
+    assert papers[0].__dict__['tags'] == ["tag a", "tag b"]
+    assert papers[0].__dict__['affiliations'] == ["Stand-in University"]
+    # 请求失败或无法解析的字段不写入缓存，渲染时回退到在线请求
+    assert 'tldr' not in papers[1].__dict__
+    assert 'tags' not in papers[1].__dict__
@@ -0,0 +1,19 @@
+from construct_email import minify_html
+
+
+def test_minify_html_keeps_text_nodes():
+    html = '<p>Uses glob a/* patterns</p><p>middle paper</p><p>ends */ here</p>'
+    assert minify_html(html) == html
+
+
+def test_minify_html_strips_template_whitespace_and_css_comments():
+    html = """
+    <style>
+      /* 卡片 */
+      .card { color : red ; }
+    </style>
+    <div style="font-size: 14px; color: #333;">
+        x  <  y
+    </div>
+"""
+    assert minify_html(html) == '<style>.card{color:red}</style><div style="font-size:14px;color:#333"> x  <  y </div>'
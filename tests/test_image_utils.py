@@ -0,0 +1,50 @@
+import io
+import math
+
+from PIL import Image, ImageDraw
+
+from image_utils import prefilter_images
+
+
+def to_png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def architecture_diagram() -> Image.Image:
+    """白底黑线的方框、箭头和标签"""
+    image = Image.new('RGB', (800, 500), 'white')
+    draw = ImageDraw.Draw(image)
+    for i in range(4):
+        x = 40 + i * 190
+        draw.rectangle([x, 200, x + 140, 280], outline='black', width=2)
+        draw.text((x + 20, 235), f'Block {i}', fill='black')
+        if i < 3:
+            draw.line([x + 140, 240, x + 190, 240], fill='black', width=2)
+            draw.polygon([(x + 190, 240), (x + 180, 235), (x + 180, 245)], fill='black')
+    return image
+
+
+def line_plot() -> Image.Image:
+    image = Image.new('RGB', (640, 480), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.line([60, 20, 60, 440, 620, 440], fill='black', width=1)
+    draw.line([(60 + i * 5, 440 - int(200 + 150 * math.sin(i / 12))) for i in range(112)], fill='black', width=1)
+    return image
+
+
+def filter_images(images: list[Image.Image]) -> list[str]:
+    candidates = [{'name': str(i), 'data': to_png(image)} for i, image in enumerate(images)]
+    return [image['name'] for image in prefilter_images(candidates, lambda image: image['data'], max_images=10)]
+
+
+def test_line_art_survives_prefilter():
+    assert filter_images([architecture_diagram(), line_plot()]) == ['0', '1']
+
+
+def test_flat_colour_and_blank_images_are_dropped():
+    logo = Image.new('RGB', (400, 300), (30, 90, 200))
+    blank = Image.new('RGB', (400, 300), 'white')
+    tiny = architecture_diagram().resize((120, 75))
+    assert filter_images([logo, blank, tiny, line_plot()]) == ['3']